@@ -0,0 +1,152 @@
+import os, json, time, inspect, contextvars, logging
+from concurrent.futures import ThreadPoolExecutor
+from prompt import dumps, count_tokens, messages_tokens
+import llm_cache
+import metrics
+
+MODEL = os.getenv("FINCOACH_MODEL", "gpt-4o-mini")
+API_KEY = os.getenv("OPENAI_API_KEY", "")
+TEMPERATURE = 0.2
+TURN_BUDGET = float(os.getenv("TURN_BUDGET_SECONDS", 45))
+FALLBACK_REPLY = "Updated. Ask for **Advice** or say **Start** to continue."
+log = logging.getLogger(__name__)
+
+TOOL_REGISTRY = {}
+TOOL_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_WORKERS", 8)))
+
+def tool(name, description, properties=None, required=None, read_only=False, compact=None):
+    def deco(fn):
+        params = list(inspect.signature(fn).parameters)[1:]
+        schema = {"type":"function","function":{"name": name,"description": description,"parameters":{"type":"object","properties": properties or {}}}}
+        if required: schema["function"]["parameters"]["required"] = required
+        TOOL_REGISTRY[name] = {"fn": fn, "params": params, "read_only": read_only, "schema": schema, "compact": compact}
+        return fn
+    return deco
+
+# openai is most of a worker's import time, so it is only loaded on the first uncached model call.
+# Benchmarks swap in a fake by assigning chat_create.
+chat_create = None
+
+def completions():
+    global chat_create
+    if chat_create is None:
+        import openai
+        openai.api_key = API_KEY
+        chat_create = openai.chat.completions.create
+    return chat_create
+
+def llm_enabled():
+    return bool(API_KEY)
+
+def tool_schemas():
+    return [t["schema"] for t in TOOL_REGISTRY.values()]
+
+def call_tool(sid, call):
+    name = call["function"]["name"]
+    t = TOOL_REGISTRY.get(name)
+    t0 = time.perf_counter()
+    err = False
+    if t is None:
+        out, err = {"error":"unknown tool"}, True
+    else:
+        # Arguments come from the model, so a bad one fails this call, not the turn; the model sees the error.
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+            out = t["fn"](sid, **{k:v for k,v in args.items() if k in t["params"]})
+            if t["compact"]: out = t["compact"](out)
+        except json.JSONDecodeError:
+            out, err = {"error":"invalid arguments"}, True
+        except Exception as e:
+            log.exception("tool %s failed", name)
+            out, err = {"error": f"{type(e).__name__}: {e}"}, True
+    payload = dumps(out)
+    ms = (time.perf_counter() - t0) * 1000
+    metrics.observe("fincoach_tool_seconds", ms / 1000, tool=name if t else "unknown")
+    metrics.span("tool", ms / 1000)
+    if err: metrics.inc("fincoach_tool_errors_total", tool=name if t else "unknown")
+    metrics.inc("fincoach_tool_output_bytes_total", len(payload), tool=name if t else "unknown")
+    return payload, {"name": name, "ms": round(ms, 2), "bytes": len(payload)}
+
+# Runs of read-only calls execute concurrently; a writing call waits for everything before it.
+def run_tools(sid, calls):
+    outs, i = [None]*len(calls), 0
+    ro = lambda c: TOOL_REGISTRY.get(c["function"]["name"], {}).get("read_only")
+    while i < len(calls):
+        j = i
+        while j < len(calls) and ro(calls[j]): j += 1
+        if j - i > 1:
+            ctxs = [contextvars.copy_context() for _ in calls[i:j]]
+            for k,out in enumerate(TOOL_POOL.map(lambda cc: cc[0].run(call_tool, sid, cc[1]), zip(ctxs, calls[i:j]))): outs[i+k] = out
+            i = j
+        else:
+            outs[i] = call_tool(sid, calls[i]); i += 1
+    return outs
+
+def complete(msgs, schemas, timeout, hop):
+    t0 = time.perf_counter()
+    key = llm_cache.request_key(MODEL, msgs, schemas, TEMPERATURE)
+    hit = llm_cache.get(key)
+    if hit is not None:
+        hop.update(prompt=0, completion=0, source="cache")
+        _model_metrics(hop, time.perf_counter() - t0)
+        if hit["content"]: yield hit["content"].replace("₦","₹")
+        return hit["content"], hit["tool_calls"]
+    stream = completions()(model=MODEL, messages=msgs, tools=schemas, temperature=TEMPERATURE, stream=True, stream_options={"include_usage": True}, timeout=timeout)
+    text, calls = [], {}
+    for chunk in stream:
+        u = getattr(chunk, "usage", None)
+        if u: hop.update(prompt=u.prompt_tokens, completion=u.completion_tokens, source="api")
+        if not chunk.choices: continue
+        d = chunk.choices[0].delta
+        if d.content:
+            text.append(d.content)
+            yield d.content.replace("₦","₹")
+        for tc in d.tool_calls or []:
+            c = calls.setdefault(tc.index, {"id":"","type":"function","function":{"name":"","arguments":""}})
+            if tc.id: c["id"] = tc.id
+            if tc.function and tc.function.name: c["function"]["name"] += tc.function.name
+            if tc.function and tc.function.arguments: c["function"]["arguments"] += tc.function.arguments
+    text, calls = "".join(text), [calls[i] for i in sorted(calls)]
+    if hop["source"] == "estimate":
+        hop["completion"] = count_tokens(text) + sum(count_tokens(c["function"]["name"]) + count_tokens(c["function"]["arguments"]) for c in calls)
+    llm_cache.put(key, {"content": text, "tool_calls": calls}, hop["prompt"], hop["completion"], time.perf_counter() - t0)
+    _model_metrics(hop, time.perf_counter() - t0)
+    return text, calls
+
+def _model_metrics(hop, seconds):
+    metrics.observe("fincoach_model_seconds", seconds, source=hop["source"])
+    metrics.span("model", seconds)
+    metrics.inc("fincoach_model_tokens_total", hop["prompt"], kind="prompt")
+    metrics.inc("fincoach_model_tokens_total", hop["completion"], kind="completion")
+
+def run_turn(sid, msgs, budget=None):
+    deadline = time.monotonic() + (budget or TURN_BUDGET)
+    turn = {"iterations": 0, "tools": [], "hops": [], "tokens": {"prompt": 0, "completion": 0}, "seconds": 0.0}
+    t0 = time.perf_counter()
+    reply = FALLBACK_REPLY
+    schemas = tool_schemas()
+    schema_tokens = count_tokens(json.dumps(schemas))
+    while time.monotonic() < deadline:
+        turn["iterations"] += 1
+        hop = {"prompt": messages_tokens(msgs) + schema_tokens, "completion": 0, "source": "estimate"}
+        gen = complete(msgs, schemas, max(deadline - time.monotonic(), 1.0), hop)
+        while True:
+            try: yield "delta", next(gen)
+            except StopIteration as e:
+                text, calls = e.value
+                break
+        turn["hops"].append(hop)
+        turn["tokens"]["prompt"] += hop["prompt"]; turn["tokens"]["completion"] += hop["completion"]
+        if not calls:
+            reply = (text or "…").replace("₦","₹")
+            break
+        msgs.append({"role":"assistant","content": text or None,"tool_calls": calls})
+        for c,(payload,m) in zip(calls, run_tools(sid, calls)):
+            turn["tools"].append(m)
+            yield "tool", c["function"]["name"]
+            msgs.append({"role":"tool","tool_call_id": c["id"], "content": payload})
+    turn["seconds"] = round(time.perf_counter() - t0, 3)
+    metrics.observe("fincoach_turn_iterations", turn["iterations"])
+    metrics.observe("fincoach_turn_seconds", turn["seconds"])
+    yield "metrics", turn
+    yield "done", reply
@@ -0,0 +1,53 @@
+import os
+from datetime import datetime, timedelta
+from storage import db_for
+from rollups import week_key
+
+NEAR = float(os.getenv("CAP_NEAR_RATIO", 0.8))
+LOOKBACK_DAYS = int(os.getenv("CAP_ALERT_LOOKBACK_DAYS", 14))   # older weeks in a bulk import are history, not news
+LEVELS = (("near", NEAR), ("breach", 1.0))
+EVENT_FIELDS = ("sid", "ts", "week", "category", "level", "spent", "weekly")
+
+_hooks = []
+
+def on_event(fn):
+    _hooks.append(fn)
+    return fn
+
+# deltas: {(week, category): [total delta, count delta]} as returned by rollups.add, already applied.
+# Reads the session's caps and the touched rollup rows only; each crossing of NEAR or 100% of a cap becomes one event.
+def check(conn, sid, deltas, newest=None):
+    caps = {r["category"]: r["weekly"] for r in conn.execute("SELECT category,weekly FROM caps WHERE sid=?", (sid,))}
+    if not caps or not deltas: return []
+    floor = week_key(newest - timedelta(days=LOOKBACK_DAYS)) if newest else ""
+    keys = [(w,c) for (w,c),(t,_) in deltas.items() if c in caps and w >= floor and t < 0]
+    if not keys: return []
+    now = datetime.utcnow().isoformat()
+    events = []
+    for w,c in keys:
+        r = conn.execute("SELECT total FROM rollups WHERE sid=? AND week=? AND category=?", (sid, w, c)).fetchone()
+        after = -r["total"] if r else 0.0
+        before = after + deltas[(w,c)][0]
+        cap = caps[c]
+        for level,ratio in LEVELS:
+            if before < ratio * cap <= after:
+                events.append({"sid": sid, "ts": now, "week": w, "category": c, "level": level, "spent": round(after, 2), "weekly": cap})
+    # UNIQUE(sid, week, category, level): a re-import of the same week does not alert twice
+    return [e for e in events if conn.execute("INSERT INTO cap_events(sid,ts,week,category,level,spent,weekly) VALUES(?,?,?,?,?,?,?) ON CONFLICT DO NOTHING", [e[k] for k in EVENT_FIELDS]).rowcount]
+
+# Called by writers after commit, so hooks never see events from a rolled-back import.
+def dispatch(events):
+    for e in events:
+        for fn in _hooks:
+            try: fn(e)
+            except Exception: pass
+
+def pending(sid, limit=50):
+    with db_for(sid) as conn:
+        rows = conn.execute("SELECT id,ts,week,category,level,spent,weekly FROM cap_events WHERE sid=? AND seen=0 ORDER BY id LIMIT ?", (sid, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+def ack(sid, ids):
+    with db_for(sid) as conn:
+        conn.executemany("UPDATE cap_events SET seen=1 WHERE sid=? AND id=?", [(sid, i) for i in ids])
+        conn.commit()
@@ -0,0 +1,96 @@
+from datetime import date
+import numpy as np
+import forecast
+from recurring import merchant_key, detect, entry
+from ledger import Txns
+
+# Running sums go through cumsum/bincount, which add left to right like the original Python loops; means and
+# other reductions may round differently, so figures agree with the pure-Python implementation to float
+# rounding, and are equal once rounded for display.
+
+class Columns:
+    __slots__ = ("n","dates","amounts","cats","cat_names","merchants","merchant_names","end")
+
+    def __init__(self, txns):
+        n = self.n = len(txns)
+        if isinstance(txns, Txns):
+            self.dates, self.amounts, self.cats, self.cat_names = txns.dates, txns.amounts, txns.cats, txns.cat_names
+            m_ix = {}
+            by_desc = np.fromiter([m_ix.setdefault(merchant_key(d), len(m_ix)) for d in txns.desc_names], np.int64, len(txns.desc_names))
+            self.merchants = by_desc[txns.descs]
+            self.merchant_names = list(m_ix)
+            self.end = txns.end
+            return
+        self.dates = np.fromiter([t["date"].toordinal() for t in txns], np.int64, n)
+        self.amounts = np.fromiter([t["amount"] for t in txns], np.float64, n)
+        cat_ix, desc_ix, m_ix = {}, {}, {}
+        self.cats = np.fromiter([cat_ix.setdefault(t["category"], len(cat_ix)) for t in txns], np.int64, n)
+        self.cat_names = list(cat_ix)
+        descs = np.fromiter([desc_ix.setdefault(t["description"], len(desc_ix)) for t in txns], np.int64, n)
+        by_desc = np.fromiter([m_ix.setdefault(merchant_key(d), len(m_ix)) for d in desc_ix], np.int64, len(desc_ix))
+        self.merchants = by_desc[descs]
+        self.merchant_names = list(m_ix)
+        self.end = int(self.dates[-1]) if n else 0
+
+def seqsum(a):
+    return float(np.cumsum(a)[-1]) if len(a) else 0
+
+def totals(cols):
+    a = cols.amounts
+    return seqsum(a[a > 0]), seqsum(-a[a < 0])
+
+def _groups(cols):
+    return cols.merchants * 2 + (cols.amounts <= 0)
+
+def recurring(cols, min_occ=None):
+    rec = {"income":[], "bills":[]}
+    found = detect(_groups(cols), cols.dates, cols.amounts, min_occ)
+    for s in sorted(found, key=lambda s: (s["first"], cols.merchant_names[s["key"] // 2])):
+        rec["income" if s["key"] % 2 == 0 else "bills"].append(entry(cols.merchant_names[s["key"] // 2], s, cols.end))
+    return rec
+
+# Active series for the forecaster plus a mask of every row that belongs to a recurring series.
+def recurring_series(cols, rec=None):
+    rec = recurring(cols) if rec is None else rec
+    ix = {m: i for i,m in enumerate(cols.merchant_names)}
+    series, keys = [], []
+    for kind,sign in (("income", 1), ("bills", -1)):
+        for e in rec[kind]:
+            if e["merchant"] in ix: keys.append(ix[e["merchant"]] * 2 + (sign < 0))
+            if e["active"]: series.append({"amount": sign * e["amount"], "period": e["every_days"], "last": date.fromisoformat(e["last"]).toordinal()})
+    return series, np.isin(_groups(cols), keys)
+
+def forecast_model(cols, rec=None, first=None):
+    return forecast.build(cols, *recurring_series(cols, rec), first=first)
+
+def cashflow(cols, horizon_days=28, starting_balance=0.0):
+    return forecast.project(forecast_model(cols), starting_balance, horizon_days)
+
+def category_spend(cols, days=30):
+    if not cols.n: return {}
+    m = (cols.dates >= cols.end - days) & (cols.amounts < 0)
+    c = cols.cats[m]
+    sums = np.bincount(c, weights=-cols.amounts[m], minlength=len(cols.cat_names))
+    _, first = np.unique(c, return_index=True)
+    out = {cols.cat_names[int(c[i])]: float(sums[c[i]]) for i in sorted(first)}
+    return dict(sorted(out.items(), key=lambda x:x[1], reverse=True))
+
+def income_sources(cols):
+    return int(np.count_nonzero(np.bincount(cols.merchants[cols.amounts > 0], minlength=len(cols.merchant_names))))
+
+# rec: stored series (recurring.load) to skip detection; detected from txns when omitted. With history
+# (ledger.history_totals) and first (ledger.first_ordinal), txns need only hold the last forecast.WINDOW_DAYS.
+def summarize(txns, horizon_days=28, starting_balance=0.0, rec=None, history=None, first=None):
+    cols = Columns(txns)
+    if history is None: (inc, exp), sources = totals(cols), income_sources(cols)
+    else: inc, exp, sources = history["income"], history["expense"], len({merchant_key(d) for d in history["income_descriptions"]})
+    rec = recurring(cols) if rec is None else rec
+    model = forecast_model(cols, rec, first)
+    return {
+        "income": inc, "expense": exp,
+        "recurring": rec,
+        "cashflow": forecast.project(model, starting_balance, horizon_days),
+        "forecast": model,
+        "categories": category_spend(cols, 30),
+        "income_sources": sources,
+    }
@@ -0,0 +1,93 @@
+import os, sys, json, time, argparse
+from datetime import datetime, date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from storage import db, init_db, partitions
+
+# Nightly analysis over every session. Workers only read; the parent is the single writer of `reports`,
+# committing one chunk at a time, so an interrupted run resumes by skipping the sids it already stored.
+
+CHUNK_SIDS = 200
+
+def _worker_init():
+    os.environ["JOB_RUNNER"] = "off"
+    global main
+    import main
+
+def analyze_chunk(sids):
+    out = []
+    for sid in sids:
+        t0 = time.perf_counter()
+        try:
+            res = main.compute_analysis(sid)
+            out.append((sid, main.data_version(sid), "ok", json.dumps({"summary": res["summary"], "figures": res["figures"], "actions": res["actions"]}, ensure_ascii=False, default=str), time.perf_counter() - t0))
+        except Exception as e:
+            out.append((sid, None, "error", json.dumps({"error": f"{type(e).__name__}: {e}"}), time.perf_counter() - t0))
+    return out
+
+def pending_sids(run):
+    sids = set()
+    for conn in partitions():
+        with conn:
+            sids.update(r["sid"] for r in conn.execute("SELECT sid FROM txns GROUP BY sid UNION SELECT sid FROM profiles GROUP BY sid"))
+    with db() as conn:
+        sids -= {r["sid"] for r in conn.execute("SELECT sid FROM reports WHERE run=?", (run,))}
+    return sorted(sids)
+
+def start_run(run, total):
+    with db() as conn:
+        conn.execute("INSERT INTO report_runs(run,started,total) VALUES(?,?,?) ON CONFLICT(run) DO UPDATE SET finished=NULL", (run, datetime.utcnow().isoformat(), total))
+        conn.execute("UPDATE report_runs SET total=done+failed+? WHERE run=?", (total, run))
+        conn.commit()
+
+def store(run, rows, jsonl=None):
+    now = datetime.utcnow().isoformat()
+    with db() as conn:
+        conn.executemany("INSERT INTO reports(run,sid,ts,version,status,result) VALUES(?,?,?,?,?,?) ON CONFLICT(run,sid) DO UPDATE SET ts=excluded.ts, version=excluded.version, status=excluded.status, result=excluded.result", [(run, sid, now, v, st, res) for sid,v,st,res,_ in rows])
+        ok = sum(1 for r in rows if r[2] == "ok")
+        conn.execute("UPDATE report_runs SET done=done+?, failed=failed+? WHERE run=?", (ok, len(rows) - ok, run))
+        conn.commit()
+    if jsonl:
+        for sid,v,st,res,secs in rows:
+            jsonl.write(json.dumps({"run": run, "sid": sid, "version": v, "status": st, "seconds": round(secs, 4), **json.loads(res)}, ensure_ascii=False) + "\n")
+        jsonl.flush()
+
+def progress(done, total, t0, failed):
+    secs = time.perf_counter() - t0
+    rate = done / secs if secs > 0 else 0.0
+    eta = (total - done) / rate if rate else 0.0
+    sys.stderr.write(f"\r{done}/{total} sessions  {rate:,.0f}/s  failed {failed}  eta {eta:,.0f}s ")
+    sys.stderr.flush()
+
+def run_batch(run, workers=None, chunk=CHUNK_SIDS, jsonl_path=None, limit=None):
+    init_db()
+    sids = pending_sids(run)[:limit]
+    start_run(run, len(sids))
+    chunks = [sids[i:i+chunk] for i in range(0, len(sids), chunk)]
+    done = failed = 0
+    t0 = last = time.perf_counter()
+    jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_worker_init) as pool:
+            for fut in as_completed([pool.submit(analyze_chunk, c) for c in chunks]):
+                rows = fut.result()
+                store(run, rows, jsonl)
+                done += len(rows); failed += sum(1 for r in rows if r[2] != "ok")
+                if time.perf_counter() - last > 1 or done == len(sids):
+                    progress(done, len(sids), t0, failed); last = time.perf_counter()
+    finally:
+        if jsonl: jsonl.close()
+    with db() as conn:
+        conn.execute("UPDATE report_runs SET finished=? WHERE run=?", (datetime.utcnow().isoformat(), run))
+        conn.commit()
+    sys.stderr.write("\n")
+    return {"run": run, "sessions": done, "failed": failed, "seconds": round(time.perf_counter() - t0, 2)}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Run analysis for every session and store it as a report.")
+    ap.add_argument("--run", default=f"nightly-{date.today().isoformat()}", help="run name; re-running the same name resumes it")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--chunk", type=int, default=CHUNK_SIDS, help="sessions per worker task")
+    ap.add_argument("--jsonl", default=None, help="also append each report to this JSONL file")
+    ap.add_argument("--limit", type=int, default=None)
+    a = ap.parse_args()
+    print(json.dumps(run_batch(a.run, a.workers, a.chunk, a.jsonl, a.limit)))
@@ -0,0 +1,139 @@
+import os, io, sys, csv, json, time, random, argparse, tempfile, platform, statistics, subprocess
+from datetime import date, timedelta
+from types import SimpleNamespace as NS
+
+# Benchmarks main.py's hot paths on synthetic statements. Runs against a throwaway database unless FINCOACH_DB is set:
+#   python bench.py --rows 1000,10000,100000 --out bench.json [--startup] [--compare old.json]
+
+os.environ.setdefault("FINCOACH_DB", os.path.join(tempfile.mkdtemp(prefix="fincoach-bench-"), "bench.db"))
+os.environ.setdefault("LLM_CACHE_MODE", "off")
+os.environ.setdefault("JOB_RUNNER", "off")
+import main, cache, agent
+
+# (description templates, amount range, rows per month); recurring ones get a fixed day of month
+RECURRING = [("Salary {month}", 80000, 0), ("Rent Landlord", -22000, 3), ("Netflix", -499, 9), ("Electricity Bill", -1450, 28), ("Mobile Recharge", -399, 14)]
+VARIABLE = [("Amazon Shopping", (300, 4000), 4), ("Uber Ride", (120, 600), 10), ("Ola Ride", (120, 500), 6), ("Swiggy", (150, 900), 12), ("Zomato", (150, 900), 8),
+            ("DMart", (400, 3500), 4), ("IRCTC", (300, 2500), 1), ("UPI Transfer", (100, 2000), 6), ("Apollo Pharmacy", (100, 1500), 2), ("Petrol Pump", (500, 3000), 3)]
+
+def merchants():
+    # every keyword in CATEGORY_KEYWORDS shows up now and then, so categorize sees the whole vocabulary
+    return [k.title() for c,ks in main.CATEGORY_KEYWORDS.items() if c != "income" for k in ks]
+
+def statement(rows, seed=7, start=date(2024, 1, 1)):
+    rnd = random.Random(seed)
+    extra = merchants()
+    per_day = (sum(n for *_,n in VARIABLE) + len(RECURRING)) / 30.0 + 0.3
+    days = max(int(rows / per_day * 1.1), 31)
+    out = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        for desc,amt,dom in RECURRING:
+            if d.day == dom + 1: out.append((d, desc.format(month=d.strftime("%B")), amt))
+        for desc,(lo,hi),n in VARIABLE:
+            if rnd.random() < n / 30.0:
+                ref = f"UPI/{rnd.randint(10**9, 10**10)}/" if rnd.random() < 0.3 else ""
+                out.append((d, ref + desc, -rnd.randint(lo, hi)))
+        if rnd.random() < 0.3: out.append((d, rnd.choice(extra), -rnd.randint(50, 3000)))
+    out = out[:rows]
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["date", "description", "amount"])
+    w.writerows((d.isoformat(), s, a) for d,s,a in out)
+    return buf.getvalue()
+
+# Streams a get_state + analyze tool call, then a short answer, in the shape of openai's chunk objects.
+def fake_create(messages, tools=None, stream=True, **kw):
+    called = any(m.get("role") == "tool" for m in messages)
+    usage = NS(prompt_tokens=sum(len(str(m.get("content") or "")) for m in messages) // 4, completion_tokens=24)
+    if called:
+        chunks = [NS(choices=[NS(delta=NS(content=w, tool_calls=None))], usage=None) for w in ["Here ", "is ", "your ", "plan."]]
+    else:
+        tc = lambda i,n: NS(index=i, id=f"call_{i}", function=NS(name=n, arguments="{}"))
+        chunks = [NS(choices=[NS(delta=NS(content=None, tool_calls=[tc(0,"get_state"), tc(1,"analyze")]))], usage=None)]
+    return iter(chunks + [NS(choices=[], usage=usage)])
+
+def timed(fn, repeat):
+    runs, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        runs.append(time.perf_counter() - t0)
+    return {"best": round(min(runs), 6), "median": round(statistics.median(runs), 6), "runs": repeat}, out
+
+def bench(rows, repeat=3):
+    sid = f"bench-{rows}"
+    text = statement(rows)
+    res = {}
+    res["parse_csv"], parsed = timed(lambda: main.parse_csv(text), repeat)
+    res["enrich_transactions"], enriched = timed(lambda: main.enrich_transactions(parsed), repeat)
+    res["insert_txns"], _ = timed(lambda: main.insert_txns(sid, enriched, "replace"), repeat)
+    res["get_txns"], txns = timed(lambda: main.get_txns(sid), repeat)
+    res["compute_analysis"], _ = timed(lambda: main.compute_analysis(sid), repeat)
+    res["detect_recurring"], _ = timed(lambda: main.detect_recurring(txns), repeat)
+    res["make_recommendations_from_txns"], _ = timed(lambda: main.make_recommendations_from_txns(txns, 20000.0), repeat)
+    real, real_key = agent.chat_create, agent.API_KEY
+    agent.chat_create, agent.API_KEY = fake_create, "bench"
+    try:
+        client = main.create_app(dev=True).test_client()
+        with client.session_transaction() as s: s["sid"] = sid
+        def chat():
+            cache.analysis_cache.clear()
+            r = client.post("/chat", json={"text": "how am I doing this month?"})
+            assert r.status_code == 200, r.status_code
+        res["chat_route"], _ = timed(chat, repeat)
+    finally:
+        agent.chat_create, agent.API_KEY = real, real_key
+    for k,v in res.items(): v["rows_per_sec"] = round(len(parsed) / v["best"], 1) if v["best"] and k != "chat_route" else None
+    return {"rows": len(parsed), "results": res}
+
+# Each run is a fresh interpreter: time to import main, build the app and serve "/", plus the worker's peak RSS.
+STARTUP = """
+import time, json, resource
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app(dev=True)
+t2 = time.perf_counter()
+app.test_client().get("/")
+t3 = time.perf_counter()
+print(json.dumps({"import_main": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def startup(repeat=3):
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = [json.loads(subprocess.run([sys.executable, "-c", STARTUP], cwd=here, capture_output=True, text=True, check=True).stdout) for _ in range(repeat)]
+    return {k: {"best": round(min(r[k] for r in runs), 6), "median": round(statistics.median(r[k] for r in runs), 6), "runs": repeat} for k in runs[0]}
+
+# A step counts as a regression when it is both `threshold` slower and at least `floor` seconds slower.
+def compare(new, old, threshold=0.25, floor=0.002):
+    scales = lambda r: r["scales"] + ([{"rows": 0, "results": r["startup"]}] if r.get("startup") else [])
+    prev = {(s["rows"], k): v["best"] for s in scales(old) for k,v in s["results"].items()}
+    out = []
+    for s in scales(new):
+        for k,v in s["results"].items():
+            b = prev.get((s["rows"], k))
+            if b:
+                ratio = v["best"] / b
+                out.append({"rows": s["rows"], "bench": k, "old": b, "new": v["best"], "ratio": round(ratio, 3), "regression": ratio > 1 + threshold and v["best"] - b > floor})
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Time FinCoach hot paths on synthetic statements.")
+    ap.add_argument("--rows", default="1000,10000,100000", help="comma-separated statement sizes")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="write JSON results here (default: stdout)")
+    ap.add_argument("--compare", default=None, help="previous results JSON; regressions over --threshold exit 1")
+    ap.add_argument("--threshold", type=float, default=0.25)
+    ap.add_argument("--startup", action="store_true", help="also time cold start in fresh interpreters (rows 0 in --compare)")
+    a = ap.parse_args()
+    report = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(), "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "scales": [bench(int(n), a.repeat) for n in a.rows.split(",")]}
+    if a.startup: report["startup"] = startup(a.repeat)
+    if a.compare:
+        with open(a.compare) as f: report["compare"] = compare(report, json.load(f), a.threshold)
+    body = json.dumps(report, indent=2)
+    if a.out:
+        with open(a.out, "w") as f: f.write(body)
+    else:
+        print(body)
+    if any(c["regression"] for c in report.get("compare", [])): sys.exit(1)
@@ -0,0 +1,63 @@
+import os, json, threading, time
+from collections import OrderedDict
+from storage import pending, read
+
+class ResultCache:
+    def __init__(self, max_entries=1024, max_bytes=32*1024*1024, ttl=300.0):
+        self.max_entries, self.max_bytes, self.ttl = max_entries, max_bytes, ttl
+        self._d = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            e = self._d.get(key)
+            if e is None or e[0] != version or e[1] < time.monotonic():
+                if e is not None: self._drop(key)
+                self.misses += 1
+                return None
+            self._d.move_to_end(key)
+            self.hits += 1
+            return e[3]
+
+    def put(self, key, version, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes: return value
+        with self._lock:
+            if key in self._d: self._drop(key)
+            self._d[key] = (version, time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._d) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._d)))
+                self.evictions += 1
+        return value
+
+    def _drop(self, key):
+        self._bytes -= self._d.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._d.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            n = self.hits + self.misses
+            return {"entries": len(self._d), "bytes": self._bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "hit_rate": round(self.hits / n, 4) if n else 0.0}
+
+analysis_cache = ResultCache(
+    int(os.getenv("ANALYSIS_CACHE_ENTRIES", 1024)),
+    int(os.getenv("ANALYSIS_CACHE_BYTES", 32*1024*1024)),
+    float(os.getenv("ANALYSIS_CACHE_TTL", 300)),
+)
+
+# A version that counts a unit's queued bumps is only meaningful inside that unit (another writer's commit can reach
+# the same number), so such results are memoized in the unit instead of the shared cache.
+def cached(kind, sid, version, compute):
+    u = pending(sid)
+    if u is not None and u.bumps: return read(sid, ("cached", kind, version), compute)
+    out = analysis_cache.get((kind, sid), version)
+    if out is None:
+        out = analysis_cache.put((kind, sid), version, compute())
+    return out
@@ -0,0 +1,91 @@
+import re
+from functools import lru_cache
+from storage import db_for, bump_version
+import rollups
+
+CATEGORY_KEYWORDS = {
+    "food & dining": ["swiggy","zomato","restaurant","cafe","uber eats","food","eat"],
+    "groceries": ["grocery","supermarket","bigbasket","dmart","more","relmart"],
+    "transport": ["uber","ola","metro","fuel","petrol","diesel","train","irctc","bus"],
+    "utilities": ["electricity","water","gas","internet","broadband","wifi","mobile","phone","recharge","dth"],
+    "rent": ["rent","landlord"],
+    "shopping": ["amazon","flipkart","myntra","ajio","nykaa","shopping"],
+    "entertainment": ["netflix","spotify","youtube","prime","hotstar","movie","theatre"],
+    "health": ["pharmacy","medical","hospital","clinic","doctor","med"],
+    "education": ["course","udemy","coursera","byju","unacademy","exam","tuition"],
+    "fees & charges": ["fee","charge","penalty","fine"],
+    "income": ["salary","payout","payment","credit","freelance","upwork","fiverr"],
+    "transfer": ["upi","imps","neft","rtgs","transfer"],
+    "other": []
+}
+
+_DIGITS = re.compile(r"\d+")
+
+@lru_cache(maxsize=65536)
+def normalize(desc):
+    return " ".join(_DIGITS.sub(" ", (desc or "").lower()).split())
+
+def compile_keywords(pairs):
+    rank = {}
+    for k,v in pairs:
+        k = normalize(k)
+        if k and k not in rank: rank[k] = v
+    if not rank: return None, rank
+    alt = "|".join(re.escape(k) for k in sorted(rank, key=len, reverse=True))
+    return re.compile(r"\b(" + alt + r")(?:e?s)?\b"), rank
+
+# Expense keywords compiled once; a match's rank is its category's position in CATEGORY_KEYWORDS.
+_CATS = [c for c in CATEGORY_KEYWORDS if c != "income"]
+_RX, _RANK = compile_keywords([(k,i) for i,c in enumerate(_CATS) for k in CATEGORY_KEYWORDS[c]])
+
+@lru_cache(maxsize=65536)
+def merchant_category(norm):
+    best = None
+    for m in _RX.finditer(norm):
+        r = _RANK[m.group(1)]
+        if best is None or r < best: best = r
+    return _CATS[best] if best is not None else "other"
+
+def infer_category(desc, amount):
+    if amount > 0: return "income"
+    return merchant_category(normalize(desc))
+
+def list_rules(sid):
+    with db_for(sid) as conn:
+        rows = conn.execute("SELECT pattern,category FROM category_rules WHERE sid=? ORDER BY pattern", (sid,)).fetchall()
+    return [{"pattern": r["pattern"], "category": r["category"]} for r in rows]
+
+def set_rule(sid, pattern, category):
+    with db_for(sid) as conn:
+        conn.execute("INSERT INTO category_rules(sid,pattern,category) VALUES(?,?,?) ON CONFLICT(sid,pattern) DO UPDATE SET category=excluded.category", (sid, normalize(pattern), category.strip().lower()))
+        conn.commit()
+
+@lru_cache(maxsize=1024)
+def _rules_regex(rules):
+    return compile_keywords(rules)
+
+# rules: list_rules(sid), loaded by callers that categorize inside an open transaction, which must not
+# reach for the pooled connection again (its `with` would commit their work).
+def categorize_many(descriptions, amounts, sid=None, rules=None):
+    rules = list_rules(sid) if rules is None and sid else rules or ()
+    rx, cats = _rules_regex(tuple((r["pattern"], r["category"]) for r in rules)) if rules else (None, {})
+    out = []
+    for d,a in zip(descriptions, amounts):
+        n = normalize(d)
+        m = rx.search(n) if rx else None
+        if m: out.append(cats[m.group(1)])
+        elif a > 0: out.append("income")
+        else: out.append(merchant_category(n))
+    return out
+
+def recategorize(sid):
+    rules = list_rules(sid)
+    with db_for(sid) as conn:
+        rows = conn.execute("SELECT hash,date,description,amount,category FROM txns WHERE sid=?", (sid,)).fetchall()
+        cats = categorize_many([r["description"] for r in rows], [r["amount"] for r in rows], rules=rules)
+        ups = [(c, r) for r,c in zip(rows, cats) if c != r["category"]]
+        conn.executemany("UPDATE txns SET category=? WHERE sid=? AND hash=?", [(c, sid, r["hash"]) for c,r in ups])
+        rollups.recategorized(conn, sid, [({"date": r["date"], "amount": r["amount"], "category": c}, r["category"]) for c,r in ups])
+        if ups: bump_version(conn, sid)
+        conn.commit()
+    return len(ups)
@@ -0,0 +1,84 @@
+import itertools
+import numpy as np
+
+MAX_HORIZON = 366
+WINDOW_DAYS = 30
+CUT_STEPS = (0.0, 0.1, 0.2, 0.3, 0.4, 0.5)
+
+# series: [{"amount": signed amount, "period": days between payments, "last": ordinal of the last payment}]
+# recurring_rows: boolean mask of the rows those series were built from; the rest is treated as variable flow.
+# first: ordinal of the session's first transaction when cols only hold the recent window.
+def build(cols, series=(), recurring_rows=None, window=WINDOW_DAYS, first=None):
+    end = cols.end
+    if not cols.n:
+        return {"end": end, "series": [], "var_income": 0.0, "var_spend": np.zeros(0), "cat_names": []}
+    span = min(window + 1, end - (int(cols.dates.min()) if first is None else first) + 1)
+    var = cols.dates >= end - window
+    if recurring_rows is not None: var &= ~recurring_rows
+    a = cols.amounts
+    spend = np.bincount(cols.cats[var & (a < 0)], weights=-a[var & (a < 0)], minlength=len(cols.cat_names)) / span
+    return {"end": end, "series": list(series), "var_income": float(a[var & (a > 0)].sum()) / span, "var_spend": spend, "cat_names": list(cols.cat_names)}
+
+def event_flows(model, horizon):
+    flows = np.zeros(horizon + 1)
+    end = model["end"]
+    for s in model["series"]:
+        p = max(int(round(s["period"])), 1)
+        nxt = s["last"] + p * max(-(-(end + 1 - s["last"]) // p), 1)
+        days = np.arange(nxt, end + horizon + 1, p) - end
+        np.add.at(flows, days, s["amount"])
+    return flows[1:]
+
+def clamp(horizon):
+    return max(1, min(int(horizon), MAX_HORIZON))
+
+def _summary(bal, starting_balance, horizon):
+    low = int(np.argmin(bal))
+    neg = np.flatnonzero(bal < 0)
+    return {
+        "projected_min": round(min(float(bal[low]), starting_balance), 2),
+        "projected_end": round(float(bal[-1]), 2),
+        "daily_avg": round((float(bal[-1]) - starting_balance) / horizon, 2),
+        "min_day": low + 1 if bal[low] < starting_balance else 0,
+        "shortfall_day": int(neg[0]) + 1 if len(neg) else None,
+    }
+
+def project(model, starting_balance=0.0, horizon=28, caps=None):
+    horizon = clamp(horizon)
+    spend = model["var_spend"]
+    if caps:
+        lim = np.array([caps.get(c, np.inf) / 7.0 for c in model["cat_names"]])
+        spend = np.minimum(spend, lim)
+    daily = model["var_income"] - float(spend.sum())
+    bal = starting_balance + np.cumsum(event_flows(model, horizon) + daily)
+    return _summary(bal, starting_balance, horizon)
+
+# weekly_caps: S x len(categories) matrix (np.inf = no cap). Evaluates every scenario in one pass.
+def evaluate(model, starting_balance, categories, weekly_caps, horizon=28):
+    horizon = clamp(horizon)
+    caps = np.atleast_2d(np.asarray(weekly_caps, dtype=np.float64))
+    ix = [model["cat_names"].index(c) for c in categories]
+    spend = model["var_spend"]
+    base = float(spend.sum()) - float(spend[ix].sum())
+    capped = np.minimum(spend[ix][None, :], caps / 7.0).sum(axis=1)
+    daily = model["var_income"] - base - capped
+    t = np.arange(1, horizon + 1)
+    bal = starting_balance + np.cumsum(event_flows(model, horizon))[None, :] + daily[:, None] * t[None, :]
+    low = bal.min(axis=1)
+    neg = bal < 0
+    short = np.where(neg.any(axis=1), neg.argmax(axis=1) + 1, 0)
+    return {"projected_min": np.minimum(low, starting_balance), "projected_end": bal[:, -1], "shortfall_day": short}
+
+def find_caps(model, starting_balance, horizon=28, top=3, steps=CUT_STEPS):
+    spend = model["var_spend"]
+    order = [int(i) for i in np.argsort(-spend)[:top] if spend[i] > 0]
+    if not order: return None
+    cats = [model["cat_names"][i] for i in order]
+    weekly = spend[order] * 7.0
+    cuts = np.array(list(itertools.product(steps, repeat=len(order))))
+    res = evaluate(model, starting_balance, cats, weekly[None, :] * (1 - cuts), horizon)
+    ok = np.flatnonzero(res["shortfall_day"] == 0)
+    if not len(ok): return {"feasible": False, "caps": {c: round(float(w), 0) for c,w in zip(cats, weekly * (1 - max(steps)))}, "scenarios": len(cuts)}
+    best = ok[np.argmin((cuts[ok] * weekly).sum(axis=1))]
+    caps = {c: round(float(w * (1 - k)), 0) for c,w,k in zip(cats, weekly, cuts[best]) if k > 0}
+    return {"feasible": True, "caps": caps, "projected_min": round(float(res["projected_min"][best]), 2), "scenarios": len(cuts)}
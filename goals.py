@@ -0,0 +1,83 @@
+import os, zlib
+import numpy as np
+import forecast
+
+PATHS = int(os.getenv("GOAL_PATHS", 10000))
+MAX_WEEKS = 104
+HISTORY_WEEKS = 26
+MIN_HISTORY_WEEKS = 4
+TRIM_STEPS = (0.1, 0.2)
+
+# Variable (non-recurring) flows per past week, newest first: income (H,) and spend by category (H, C).
+# Only whole weeks are kept, so a statement that starts mid-week does not read as a quiet week.
+def weekly_history(cols, recurring_rows, first=None, weeks=HISTORY_WEEKS):
+    first = int(cols.dates.min()) if first is None else first
+    span = max(1, min(weeks, (cols.end - first + 1) // 7))
+    w = (cols.end - cols.dates) // 7
+    keep = (w < span) & ~recurring_rows
+    a, C = cols.amounts, len(cols.cat_names)
+    inc = keep & (a > 0)
+    out = keep & (a < 0)
+    income = np.bincount(w[inc], weights=a[inc], minlength=span)
+    spend = np.bincount(w[out] * C + cols.cats[out], weights=-a[out], minlength=span * C).reshape(span, C)
+    return income, spend
+
+def recurring_weekly(model, weeks):
+    return forecast.event_flows(model, weeks * 7).reshape(weeks, 7).sum(axis=1)
+
+# Scheduled income alone, averaged per week; net weekly flows would hide salary behind bills due the same week.
+def recurring_income(model, weeks):
+    return float(forecast.event_flows({**model, "series": [x for x in model["series"] if x["amount"] > 0]}, weeks * 7).sum()) / weeks
+
+# plans: [{"name", "weekly_save", "caps": {category: weekly cap}}]. Every week of every path replays a past week
+# (income and per-category spend together, so their correlation survives), adds the scheduled recurring flows,
+# clips capped categories, then moves up to weekly_save into the goal if the balance covers it.
+def simulate(rec_weekly, income, spend, cat_names, plans, start, target, paths=PATHS, seed=0):
+    weeks, P = len(rec_weekly), len(plans)
+    ix = {c: i for i,c in enumerate(cat_names)}
+    cap = np.full((P, len(cat_names)), np.inf)
+    for p,plan in enumerate(plans):
+        for c,v in (plan.get("caps") or {}).items():
+            if c in ix: cap[p, ix[c]] = v
+    net = income[None, :] - np.minimum(spend[None, :, :], cap[:, None, :]).sum(axis=2)
+    save = np.array([max(float(p["weekly_save"]), 0.0) for p in plans])[:, None]
+    pick = np.random.default_rng(seed).integers(0, len(income), size=(weeks, paths))
+    bal = np.full((P, paths), float(start))
+    goal = np.zeros((P, paths))
+    reached = np.full((P, paths), weeks + 1)
+    short = np.zeros((P, paths), bool)
+    for k in range(weeks):
+        bal += rec_weekly[k] + net[:, pick[k]]
+        short |= bal < 0
+        t = np.clip(np.minimum(save, bal), 0, np.maximum(target - goal, 0))
+        bal -= t
+        goal += t
+        reached[(goal >= target) & (reached > weeks)] = k + 1
+    q = np.percentile(reached, [50, 90], axis=1, method="higher")
+    return [{
+        **plan,
+        "reach_probability": round(float((reached[p] <= weeks).mean()), 3),
+        "weeks_p50": int(q[0, p]) if q[0, p] <= weeks else None,
+        "weeks_p90": int(q[1, p]) if q[1, p] <= weeks else None,
+        "shortfall_probability": round(float(short[p].mean()), 3),
+        "saved_p50": round(float(np.median(goal[p])), 0),
+        "end_balance_p10": round(float(np.percentile(bal[p], 10)), 0),
+    } for p,plan in enumerate(plans)]
+
+# Baseline saves 10% of average weekly income under the saved caps; the others save more, or trim the
+# three largest variable categories and save what the trim frees up.
+def default_plans(weekly_income, spend, cat_names, saved_caps=None, top=3, steps=TRIM_STEPS):
+    saved_caps = dict(saved_caps or {})
+    base = max(300.0, round(weekly_income * 0.1, 0))
+    plans = [{"name": "current", "weekly_save": base, "caps": saved_caps},
+             {"name": "save 20%", "weekly_save": max(base, round(weekly_income * 0.2, 0)), "caps": saved_caps}]
+    avg = spend.mean(axis=0) if len(spend) else np.zeros(len(cat_names))
+    order = [int(i) for i in np.argsort(-avg)[:top] if avg[i] > 0]
+    for k in steps:
+        caps = dict(saved_caps)
+        for i in order: caps[cat_names[i]] = round(min(float(avg[i]) * (1 - k), saved_caps.get(cat_names[i], np.inf)), 0)
+        plans.append({"name": f"trim top {len(order)} by {int(k * 100)}%", "weekly_save": round(base + float(avg[order].sum()) * k, 0), "caps": caps})
+    return plans if order else plans[:2]
+
+def seed_for(sid, version):
+    return zlib.crc32(f"{sid}:{version}".encode())
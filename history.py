@@ -0,0 +1,81 @@
+import json, threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from storage import db_for, partitions, write
+
+HISTORY_WINDOW = 80
+RING_SIDS = 1024
+
+_rings = OrderedDict()
+_lock = threading.Lock()
+
+def set_history(sid, role, content):
+    write(sid, "INSERT INTO history(sid,role,content,ts) VALUES(?,?,?,?)", (sid, role, content, datetime.utcnow().isoformat()))
+
+def _tail(sid, after, n):
+    with db_for(sid) as conn:
+        rows = conn.execute("SELECT seq,role,content FROM history WHERE sid=? AND seq>? ORDER BY seq DESC LIMIT ?", (sid, after, n)).fetchall()
+    return [(r["seq"], r["role"], r["content"]) for r in reversed(rows)]
+
+# Resets and compactions only ever delete the oldest rows, so a changed MIN(seq) means another process
+# removed turns this ring still holds.
+def _first_seq(sid):
+    with db_for(sid) as conn:
+        return conn.execute("SELECT MIN(seq) FROM history WHERE sid=?", (sid,)).fetchone()[0]
+
+def get_history(sid, limit=HISTORY_WINDOW):
+    if limit > HISTORY_WINDOW:
+        return [{"role":r,"content":c} for (_,r,c) in _tail(sid, 0, limit)]
+    with _lock:
+        ring = _rings.get(sid)
+        if ring is not None: _rings.move_to_end(sid)
+    if ring is None:
+        ring = {"buf": deque(maxlen=HISTORY_WINDOW), "seq": 0, "first": None, "lock": threading.Lock()}
+        with _lock:
+            ring = _rings.setdefault(sid, ring)
+            while len(_rings) > RING_SIDS: _rings.popitem(last=False)
+    with ring["lock"]:
+        first = _first_seq(sid)
+        if first != ring["first"]:
+            ring["buf"].clear()
+            ring["seq"], ring["first"] = 0, first
+        new = _tail(sid, ring["seq"], HISTORY_WINDOW)
+        if new:
+            ring["buf"].extend(new)
+            ring["seq"] = new[-1][0]
+        rows = list(ring["buf"])[-limit:] if limit > 0 else []
+    return [{"role":r,"content":c} for (_,r,c) in rows]
+
+def forget(sid):
+    with _lock:
+        _rings.pop(sid, None)
+
+def summarize_turns(rows):
+    asks = [c.strip().splitlines()[0][:60] for (_,r,c,_) in rows if r == "user" and (c or "").strip()]
+    s = f"{len(rows)} turns between {rows[0][3][:10]} and {rows[-1][3][:10]}."
+    if asks: s += " User asked: " + "; ".join(asks[-5:])
+    return s
+
+def compact_history(sid, keep=HISTORY_WINDOW):
+    with db_for(sid) as conn:
+        cut = conn.execute("SELECT seq FROM history WHERE sid=? ORDER BY seq DESC LIMIT 1 OFFSET ?", (sid, keep)).fetchone()
+        if not cut: return {"archived": 0}
+        rows = [(r["seq"], r["role"], r["content"], r["ts"]) for r in conn.execute("SELECT seq,role,content,ts FROM history WHERE sid=? AND seq<=? ORDER BY seq ASC", (sid, cut["seq"]))]
+        body = json.dumps([{"role":r,"content":c,"ts":t} for (_,r,c,t) in rows])
+        conn.execute("INSERT INTO history_archive(sid,seq_from,seq_to,ts_from,ts_to,turns,summary,body) VALUES(?,?,?,?,?,?,?,?)", (sid, rows[0][0], rows[-1][0], rows[0][3], rows[-1][3], len(rows), summarize_turns(rows), body))
+        conn.execute("DELETE FROM history WHERE sid=? AND seq<=?", (sid, cut["seq"]))
+        conn.commit()
+    forget(sid)
+    return {"archived": len(rows)}
+
+def compact_all(keep=HISTORY_WINDOW):
+    sids = []
+    for conn in partitions():
+        with conn:
+            sids += [r["sid"] for r in conn.execute("SELECT sid FROM history GROUP BY sid HAVING COUNT(*)>?", (keep,))]
+    return {"sessions": len(sids), "archived": sum(compact_history(s, keep)["archived"] for s in sids)}
+
+if __name__ == "__main__":
+    import sys
+    keep = int(sys.argv[1]) if len(sys.argv) > 1 else HISTORY_WINDOW
+    print(json.dumps(compact_all(keep)))
@@ -0,0 +1,160 @@
+import csv, io, time
+from collections import Counter
+from datetime import datetime, date
+from itertools import islice, chain
+from storage import db_for, txn_key, txn_hash, bump_version
+import recurring, rollups, alerts
+
+DATE_FORMATS = ("%Y-%m-%d","%d/%m/%Y","%d-%m-%Y","%m/%d/%Y")
+COLUMN_ALIASES = {
+    "date": ["date","txn date","transaction date","value date","posting date"],
+    "description": ["description","desc","narration","particulars","details","remarks"],
+    "amount": ["amount","amt","transaction amount"],
+    "debit": ["debit","withdrawal","withdrawal amt.","withdrawal amount","dr"],
+    "credit": ["credit","deposit","deposit amt.","deposit amount","cr"],
+}
+SNIFF_ROWS = 50
+CHUNK_ROWS = 5000
+
+def map_columns(header):
+    names = [(h or "").strip().lower() for h in header]
+    cols = {}
+    for field,aliases in COLUMN_ALIASES.items():
+        for a in aliases:
+            if a in names:
+                cols[field] = names.index(a); break
+    return cols
+
+def _fast_parser(fmt):
+    sep = fmt[2]
+    order = [p[1] for p in fmt.split(sep)]
+    def parse(s):
+        p = s.split(sep)
+        if len(p) != 3 or not all(x.isdigit() for x in p): raise ValueError(s)
+        v = dict(zip(order, p))
+        if len(v["Y"]) != 4 or len(v["m"]) > 2 or len(v["d"]) > 2: raise ValueError(s)
+        return date(int(v["Y"]), int(v["m"]), int(v["d"]))
+    return parse
+
+def parse_date_any(s):
+    for fmt in DATE_FORMATS:
+        try: return datetime.strptime(s, fmt).date()
+        except: pass
+    try: return datetime.fromisoformat(s).date()
+    except: return None
+
+def detect_date_format(samples):
+    best, score = DATE_FORMATS[0], -1
+    for fmt in DATE_FORMATS:
+        parse = _fast_parser(fmt)
+        n = 0
+        for s in samples:
+            try: parse(s); n += 1
+            except: pass
+        if n > score: best, score = fmt, n
+    return best
+
+def date_parser(fmt):
+    fast = _fast_parser(fmt)
+    def parse(s):
+        try: return fast(s)
+        except: return parse_date_any(s)
+    return parse
+
+def _amount(row, cols):
+    if "amount" in cols:
+        v = row[cols["amount"]] if cols["amount"] < len(row) else ""
+        return float(str(v or "0").replace(",","").strip())
+    def num(k):
+        i = cols.get(k)
+        v = (row[i] if i is not None and i < len(row) else "").replace(",","").strip()
+        return float(v) if v else 0.0
+    return num("credit") - num("debit")
+
+def parse_stream(f, stats=None):
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0); stats.setdefault("rejected", 0)
+    reader = (r for r in csv.reader(f) if any((c or "").strip() for c in r))
+    header = next(reader, None)
+    if header is None: return
+    cols = map_columns(header)
+    if "amount" not in cols and "debit" not in cols and "credit" not in cols:
+        stats["error"] = "no amount column"; return
+    head = list(islice(reader, SNIFF_ROWS))
+    di, ni = cols.get("date"), cols.get("description")
+    field = lambda r, i: (r[i] if i is not None and i < len(r) else "").strip()
+    fmt = stats["date_format"] = detect_date_format([field(r, di) for r in head])
+    parse = date_parser(fmt)
+    for r in chain(head, reader):
+        dt = parse(field(r, di))
+        if not dt:
+            stats["rejected"] += 1; continue
+        try: amount = _amount(r, cols)
+        except:
+            stats["rejected"] += 1; continue
+        stats["rows"] += 1
+        yield {"date": dt, "description": field(r, ni), "amount": amount}
+
+def chunked(it, n=CHUNK_ROWS):
+    it = iter(it)
+    while True:
+        part = list(islice(it, n))
+        if not part: return
+        yield part
+
+def write_txns(conn, sid, rows, mode="replace", seen=None, summary=None):
+    seen = seen if seen is not None else Counter()
+    summary = summary if summary is not None else {"inserted": 0, "skipped": 0, "updated": 0, "alerts": []}
+    keyed, deltas = [], {}
+    for r in rows:
+        k = txn_key(r["date"], r["description"], r["amount"])
+        keyed.append((txn_hash(k, seen[k]), r))
+        seen[k] += 1
+    if mode == "merge" and keyed:
+        have = {}
+        hs = [h for h,_ in keyed]
+        for i in range(0, len(hs), 900):
+            part = hs[i:i+900]
+            q = f"SELECT hash,category FROM txns WHERE sid=? AND hash IN ({','.join('?'*len(part))})"
+            have.update((x["hash"], x["category"]) for x in conn.execute(q, (sid, *part)))
+        moves = [(h, r, have[h]) for h,r in keyed if h in have and have[h] in (None,"","other") and r["category"] not in (None,"","other")]
+        conn.executemany("UPDATE txns SET category=? WHERE sid=? AND hash=?", [(r["category"], sid, h) for h,r,_ in moves])
+        deltas = rollups.recategorized(conn, sid, [(r, old) for _,r,old in moves])
+        summary["updated"] += len(moves)
+        summary["skipped"] += sum(1 for h,_ in keyed if h in have) - len(moves)
+        keyed = [(h,r) for h,r in keyed if h not in have]
+    conn.executemany("INSERT INTO txns(sid,date,description,amount,category,hash) VALUES(?,?,?,?,?,?) ON CONFLICT DO NOTHING", [(sid, r["date"].isoformat(), r["description"], r["amount"], r["category"], h) for h,r in keyed])
+    summary["inserted"] += len(keyed)
+    recurring.update(conn, sid, [r for _,r in keyed])
+    for k,(t,n) in rollups.add(conn, sid, [r for _,r in keyed]).items():
+        d = deltas.setdefault(k, [0.0, 0]); d[0] += t; d[1] += n
+    if rows: summary["alerts"] += alerts.check(conn, sid, deltas, max(r["date"] for r in rows))
+    return summary
+
+def clear_txns(conn, sid):
+    conn.execute("DELETE FROM txns WHERE sid=?", (sid,))
+    conn.execute("DELETE FROM recurring_state WHERE sid=?", (sid,))
+    conn.execute("DELETE FROM rollups WHERE sid=?", (sid,))
+
+def import_stream(sid, f, enrich, mode="merge"):
+    t0 = time.perf_counter()
+    stats = {}
+    seen, summary = Counter(), {"inserted": 0, "skipped": 0, "updated": 0, "alerts": []}
+    with db_for(sid) as conn:
+        if mode == "replace": clear_txns(conn, sid)
+        for part in chunked(parse_stream(f, stats)):
+            write_txns(conn, sid, enrich(part), mode, seen, summary)
+        if "error" in stats:
+            conn.rollback()
+            return stats
+        bump_version(conn, sid)
+        conn.commit()
+    alerts.dispatch(summary["alerts"])
+    stats.update(summary)
+    secs = time.perf_counter() - t0
+    stats["seconds"] = round(secs, 3)
+    stats["rows_per_sec"] = round(stats.get("rows", 0) / secs, 1) if secs > 0 else 0.0
+    return stats
+
+def text_stream(raw):
+    return io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
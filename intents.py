@@ -0,0 +1,21 @@
+import re
+
+_POLITE = r"(?:please\s+|pls\s+|can you\s+|could you\s+|kindly\s+)?"
+_END = r"(?:\s+(?:please|pls|now|for me))?\s*[.!?]*"
+
+# Whole-message patterns only: anything more specific than a bare command goes to the model.
+INTENTS = [
+    ("advice", rf"{_POLITE}(?:give me\s+|show me\s+|get\s+)?(?:some\s+|my\s+)?(?:advice|analy[sz]e|analysis|recommendations?|overview|summary)(?:\s+(?:(?:on|of|for)\s+)?my\s+(?:spending|finances|money|transactions|data))?"),
+    ("set_caps", rf"{_POLITE}(?:set|apply|create|suggest(?: and set)?)\s+(?:my\s+|some\s+)?(?:weekly\s+)?(?:caps|budgets|limits|spending caps)"),
+    ("list_caps", rf"{_POLITE}(?:show|list|what are)\s+(?:my\s+)?(?:weekly\s+)?(?:caps|budgets|limits)"),
+    ("sample", rf"{_POLITE}(?:use|load|try)\s+(?:the\s+)?(?:sample|demo)(?:\s+data)?|sample(?:\s+data)?"),
+    ("reset", rf"{_POLITE}(?:reset|start over|clear (?:my\s+)?(?:data|everything|session))"),
+]
+_COMPILED = [(name, re.compile(rf"^\s*(?:{p}){_END}$", re.IGNORECASE)) for name,p in INTENTS]
+
+def classify(text):
+    t = " ".join((text or "").split())
+    if len(t) > 80: return None
+    for name,rx in _COMPILED:
+        if rx.match(t): return name
+    return None
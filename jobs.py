@@ -0,0 +1,133 @@
+import os, json, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from storage import db
+
+WORKERS = int(os.getenv("JOB_WORKERS", 4))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", 2))
+STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 600))
+RUNNER = os.getenv("JOB_RUNNER", "on") == "on"   # off: jobs are queued but this process never runs them
+PRUNE_DAYS = int(os.getenv("JOB_PRUNE_DAYS", 7))
+SWEEP_SECONDS = 60
+
+JOB_REGISTRY = {}
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="job")
+_cond = threading.Condition()
+_swept = 0.0
+
+def job(kind):
+    def deco(fn):
+        JOB_REGISTRY[kind] = fn
+        return fn
+    return deco
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+# A queued job identical to one already waiting for the same sid is coalesced into it.
+def submit(sid, kind, **args):
+    if kind not in JOB_REGISTRY: raise KeyError(f"unknown job kind: {kind}")
+    body = json.dumps(args, sort_keys=True)
+    with db() as conn:
+        r = conn.execute("SELECT id FROM jobs WHERE sid=? AND kind=? AND args=? AND status='queued'", (sid, kind, body)).fetchone()
+        jid = r["id"] if r else conn.execute("INSERT INTO jobs(sid,kind,args,status,attempts,run_after,created) VALUES(?,?,?,'queued',0,0,?) RETURNING id", (sid, kind, body, _now())).fetchone()[0]
+        conn.commit()
+    kick()
+    return jid
+
+# Claims runnable jobs oldest first. A sid with a running job, or an older job still waiting on a retry delay,
+# gets nothing new, so each sid's jobs run one at a time and in order; the claim is a conditional UPDATE,
+# so several processes sharing the file never start the same job twice.
+def kick():
+    global _swept
+    if not RUNNER: return 0
+    picked = []
+    with _cond, db() as conn:
+        if time.monotonic() - _swept > SWEEP_SECONDS:
+            _swept = time.monotonic()
+            _sweep(conn)
+        busy = {r["sid"] for r in conn.execute("SELECT DISTINCT sid FROM jobs WHERE status='running'")}
+        now = time.time()
+        for r in conn.execute("SELECT id,sid,kind,args,attempts,run_after FROM jobs WHERE status='queued' ORDER BY id").fetchall():
+            if r["sid"] in busy: continue
+            busy.add(r["sid"])
+            if r["run_after"] > now: continue
+            if conn.execute("UPDATE jobs SET status='running', attempts=attempts+1, started=? WHERE id=? AND status='queued'", (_now(), r["id"])).rowcount:
+                picked.append(dict(r))
+        conn.commit()
+    for r in picked: _pool.submit(_run, r)
+    return len(picked)
+
+def _run(r):
+    attempt = r["attempts"] + 1
+    try:
+        out = JOB_REGISTRY[r["kind"]](r["sid"], **json.loads(r["args"]))
+        status, result, error = "done", json.dumps(out, default=str, ensure_ascii=False), None
+    except Exception as e:
+        status, result, error = ("failed" if attempt >= MAX_ATTEMPTS else "queued"), None, f"{type(e).__name__}: {e}"
+    delay = RETRY_SECONDS * 2 ** (attempt - 1)
+    with db() as conn:
+        conn.execute("UPDATE jobs SET status=?, result=?, error=?, finished=?, run_after=? WHERE id=?", (status, result, error, None if status == "queued" else _now(), time.time() + delay, r["id"]))
+        conn.commit()
+    with _cond: _cond.notify_all()
+    if status == "queued": threading.Timer(delay, kick).start()
+    kick()
+
+def _row(r):
+    out = dict(r)
+    out["args"] = json.loads(out["args"] or "{}")
+    out["result"] = json.loads(out["result"]) if out["result"] else None
+    out.pop("run_after", None)
+    return out
+
+def status(jid, sid=None):
+    with db() as conn:
+        r = conn.execute("SELECT * FROM jobs WHERE id=?", (jid,)).fetchone()
+    if r is None or (sid is not None and r["sid"] != sid): return None
+    return _row(r)
+
+def list_jobs(sid, limit=20):
+    with db() as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE sid=? ORDER BY id DESC LIMIT ?", (sid, limit)).fetchall()
+    return [_row(r) for r in rows]
+
+# A job still 'running' after STALE_SECONDS lost its worker (crash, or a failed final UPDATE); nothing waits on it.
+def pending(sid):
+    with db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE sid=? AND (status='queued' OR (status='running' AND started>=?))", (sid, _stale_cutoff())).fetchone()[0]
+
+def wait(jid, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        s = status(jid)
+        left = deadline - time.monotonic()
+        if s is None or s["status"] in ("done", "failed") or left <= 0: return s
+        with _cond: _cond.wait(min(left, 0.5))
+
+# Lets a request that reads the sid's data see the result of work queued before it.
+def wait_idle(sid, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    kick()
+    while pending(sid):
+        left = deadline - time.monotonic()
+        if left <= 0: return False
+        with _cond: _cond.wait(min(left, 0.5))
+    return True
+
+def _stale_cutoff():
+    return (datetime.utcnow() - timedelta(seconds=STALE_SECONDS)).isoformat()
+
+# Requeues jobs whose worker is gone and drops finished jobs older than PRUNE_DAYS; kick runs it once a minute.
+def _sweep(conn):
+    n = conn.execute("UPDATE jobs SET status='queued', run_after=0 WHERE status='running' AND started<?", (_stale_cutoff(),)).rowcount
+    conn.execute("DELETE FROM jobs WHERE status IN ('done','failed') AND finished<?", ((datetime.utcnow() - timedelta(days=PRUNE_DAYS)).isoformat(),))
+    return n
+
+def recover():
+    if not RUNNER: return 0
+    with db() as conn:
+        n = _sweep(conn)
+        conn.commit()
+    kick()
+    return n
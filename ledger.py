@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+from functools import lru_cache
+import numpy as np
+from storage import db_for
+
+# Transactions held as columns: day ordinals, float amounts, and category/description codes into
+# interned name lists. Iterating still yields records that read like the old dicts (t["date"], t["amount"], ...).
+
+@lru_cache(maxsize=8192)
+def ordinal(iso):
+    return date.fromisoformat(iso[:10]).toordinal()
+
+class Txn:
+    __slots__ = ("date","description","amount","category")
+
+    def __init__(self, date, description, amount, category):
+        self.date, self.description, self.amount, self.category = date, description, amount, category
+
+    def __getitem__(self, k):
+        return getattr(self, k)
+
+    def get(self, k, default=None):
+        return getattr(self, k, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self):
+        return f"Txn({self.date}, {self.description!r}, {self.amount}, {self.category!r})"
+
+class Txns:
+    __slots__ = ("dates","amounts","cats","cat_names","descs","desc_names")
+
+    def __init__(self, dates, amounts, cats, cat_names, descs, desc_names):
+        self.dates, self.amounts, self.cats, self.cat_names, self.descs, self.desc_names = dates, amounts, cats, cat_names, descs, desc_names
+
+    @classmethod
+    def from_rows(cls, rows):
+        cat_ix, desc_ix = {}, {}
+        d, a, c, s = [], [], [], []
+        for r in rows:
+            x = r["date"]
+            d.append(x.toordinal() if isinstance(x, date) else ordinal(x))
+            a.append(r["amount"])
+            c.append(cat_ix.setdefault(r["category"], len(cat_ix)))
+            s.append(desc_ix.setdefault(r["description"], len(desc_ix)))
+        return cls(np.array(d, np.int64), np.array(a, np.float64), np.array(c, np.int64), list(cat_ix), np.array(s, np.int64), list(desc_ix))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __iter__(self):
+        for o,a,c,s in zip(self.dates.tolist(), self.amounts.tolist(), self.cats.tolist(), self.descs.tolist()):
+            yield Txn(date.fromordinal(o), self.desc_names[s], a, self.cat_names[c])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Txns(self.dates[i], self.amounts[i], self.cats[i], self.cat_names, self.descs[i], self.desc_names)
+        return Txn(date.fromordinal(int(self.dates[i])), self.desc_names[self.descs[i]], float(self.amounts[i]), self.cat_names[self.cats[i]])
+
+    @property
+    def end(self):
+        return int(self.dates[-1]) if len(self.dates) else 0
+
+# days: only rows within `days` of the session's latest transaction, read through idx_txns_sid_date.
+def load(sid, days=None):
+    q, args = "SELECT date,description,amount,category FROM txns WHERE sid=?", [sid]
+    with db_for(sid) as conn:
+        if days is not None:
+            last = conn.execute("SELECT MAX(date) FROM txns WHERE sid=?", (sid,)).fetchone()[0]
+            q += " AND date >= ?"
+            args.append((date.fromisoformat(last) - timedelta(days=int(days))).isoformat() if last else last)
+        rows = conn.execute(q + " ORDER BY date ASC", args).fetchall()
+    cat_ix, desc_ix = {}, {}
+    n = len(rows)
+    return Txns(
+        np.fromiter((ordinal(r[0]) for r in rows), np.int64, n),
+        np.fromiter((r[2] for r in rows), np.float64, n),
+        np.fromiter((cat_ix.setdefault(r[3], len(cat_ix)) for r in rows), np.int64, n), list(cat_ix),
+        np.fromiter((desc_ix.setdefault(r[1], len(desc_ix)) for r in rows), np.int64, n), list(desc_ix))
+
+# Whole-history figures read from idx_txns_sid_amount without touching rows: income and expense totals, and the
+# distinct payer descriptions.
+def history_totals(sid):
+    with db_for(sid) as conn:
+        r = conn.execute("SELECT (SELECT COALESCE(SUM(amount),0) FROM txns WHERE sid=? AND amount>0), (SELECT COALESCE(-SUM(amount),0) FROM txns WHERE sid=? AND amount<0)", (sid, sid)).fetchone()
+        descs = [x[0] for x in conn.execute("SELECT DISTINCT description FROM txns WHERE sid=? AND amount>0", (sid,))]
+    return {"income": float(r[0]), "expense": float(r[1]), "income_descriptions": descs}
+
+def first_ordinal(sid):
+    with db_for(sid) as conn:
+        d = conn.execute("SELECT MIN(date) FROM txns WHERE sid=?", (sid,)).fetchone()[0]
+    return ordinal(d) if d else None
+
+def has_txns(sid):
+    with db_for(sid) as conn:
+        return conn.execute("SELECT 1 FROM txns WHERE sid=? LIMIT 1", (sid,)).fetchone() is not None
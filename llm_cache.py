@@ -0,0 +1,77 @@
+import os, json, hashlib, threading
+from datetime import datetime
+from storage import db
+
+# off: never cache; on: read and write; record: always call the model and store; replay: serve only from cache.
+MODE = os.getenv("LLM_CACHE_MODE", "on")
+MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", 20000))
+EVICT_EVERY = 100
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "saved_prompt_tokens": 0, "saved_completion_tokens": 0, "saved_seconds": 0.0}
+_puts = 0
+
+def _norm_args(a):
+    try: return json.dumps(json.loads(a or "{}"), sort_keys=True)
+    except ValueError: return a or ""
+
+def _norm_message(m):
+    c = m.get("content")
+    out = {"role": m["role"], "content": " ".join(c.split()) if isinstance(c, str) else c}
+    if m.get("tool_calls"):
+        out["tool_calls"] = [[tc["function"]["name"], _norm_args(tc["function"]["arguments"])] for tc in m["tool_calls"]]
+    return out
+
+def request_key(model, messages, tools, temperature):
+    body = {"model": model, "temperature": temperature, "tools": tools, "messages": [_norm_message(m) for m in messages]}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def get(key):
+    if MODE in ("off", "record"): return None
+    with db() as conn:
+        r = conn.execute("SELECT response,prompt_tokens,completion_tokens,seconds FROM llm_cache WHERE key=?", (key,)).fetchone()
+        if r: conn.execute("UPDATE llm_cache SET hits=hits+1, last_used=? WHERE key=?", (datetime.utcnow().isoformat(), key))
+        conn.commit()
+    with _lock:
+        if r is None:
+            _stats["misses"] += 1
+        else:
+            _stats["hits"] += 1
+            _stats["saved_prompt_tokens"] += r["prompt_tokens"]; _stats["saved_completion_tokens"] += r["completion_tokens"]; _stats["saved_seconds"] += r["seconds"]
+    if r is None:
+        if MODE == "replay": raise LookupError(f"llm cache miss in replay mode: {key[:12]}")
+        return None
+    return json.loads(r["response"])
+
+def put(key, response, prompt_tokens=0, completion_tokens=0, seconds=0.0):
+    global _puts
+    if MODE in ("off", "replay"): return
+    now = datetime.utcnow().isoformat()
+    body = json.dumps(response, ensure_ascii=False)
+    with db() as conn:
+        conn.execute("INSERT INTO llm_cache(key,response,bytes,prompt_tokens,completion_tokens,seconds,created,last_used,hits) VALUES(?,?,?,?,?,?,?,?,0) ON CONFLICT(key) DO UPDATE SET response=excluded.response, bytes=excluded.bytes, last_used=excluded.last_used", (key, body, len(body), prompt_tokens, completion_tokens, seconds, now, now))
+        conn.commit()
+    with _lock:
+        _stats["stores"] += 1
+        _puts += 1
+        due = _puts % EVICT_EVERY == 0
+    if due: evict()
+
+def evict(max_rows=None):
+    max_rows = max_rows or MAX_ROWS
+    with db() as conn:
+        n = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if n <= max_rows: return 0
+        conn.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used ASC LIMIT ?)", (n - max_rows,))
+        conn.commit()
+    with _lock: _stats["evictions"] += n - max_rows
+    return n - max_rows
+
+def stats():
+    with _lock:
+        s = dict(_stats)
+    n = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / n, 4) if n else 0.0
+    s["saved_seconds"] = round(s["saved_seconds"], 3)
+    s["mode"] = MODE
+    return s
@@ -1,47 +1,32 @@
 # fincoach_llm_agent_ultra_v4.py
-import os, json, sqlite3, csv, re
+import os, json, re, gzip, hashlib
+from functools import lru_cache
 from uuid import uuid4
 from io import StringIO
-from datetime import datetime, timedelta
-from statistics import mean
-from collections import defaultdict, Counter
-from flask import Flask, request, jsonify, render_template_string, session
-import openai
-
-openai.api_key = os.getenv("OPENAI_API_KEY", "")
-app = Flask(__name__)
-app.secret_key = "change-this-secret"
-DB_PATH = "fincoach.db"
-
-def db():
-    c = sqlite3.connect(DB_PATH)
-    c.row_factory = sqlite3.Row
-    return c
-
-def init_db():
-    with db() as conn:
-        conn.execute("CREATE TABLE IF NOT EXISTS profiles (sid TEXT, key TEXT, value TEXT, PRIMARY KEY (sid,key));")
-        conn.execute("CREATE TABLE IF NOT EXISTS txns (sid TEXT, date TEXT, description TEXT, amount REAL, category TEXT);")
-        conn.execute("CREATE TABLE IF NOT EXISTS history (sid TEXT, role TEXT, content TEXT, ts TEXT);")
-        conn.execute("CREATE TABLE IF NOT EXISTS caps (sid TEXT, category TEXT, weekly REAL, PRIMARY KEY (sid,category));")
-        conn.commit()
-init_db()
-
-CATEGORY_KEYWORDS = {
-    "food & dining": ["swiggy","zomato","restaurant","cafe","uber eats","food","eat"],
-    "groceries": ["grocery","supermarket","bigbasket","dmart","more","relmart"],
-    "transport": ["uber","ola","metro","fuel","petrol","diesel","train","irctc","bus"],
-    "utilities": ["electricity","water","gas","internet","broadband","wifi","mobile","phone","recharge","dth"],
-    "rent": ["rent","landlord"],
-    "shopping": ["amazon","flipkart","myntra","ajio","nykaa","shopping"],
-    "entertainment": ["netflix","spotify","youtube","prime","hotstar","movie","theatre"],
-    "health": ["pharmacy","medical","hospital","clinic","doctor","med"],
-    "education": ["course","udemy","coursera","byju","unacademy","exam","tuition"],
-    "fees & charges": ["fee","charge","penalty","fine"],
-    "income": ["salary","payout","payment","credit","freelance","upwork","fiverr"],
-    "transfer": ["upi","imps","neft","rtgs","transfer"],
-    "other": []
-}
+from datetime import datetime
+from flask import Flask, Blueprint, request, jsonify, session, Response, g
+from storage import db, db_for, bump_version, data_version, unit_of_work, pending, write, read, forget_reads, discard
+from cache import cached, analysis_cache
+from agent import tool, tool_schemas, run_turn, llm_enabled, TURN_BUDGET
+from prompt import build_messages, compact_analysis, compact_state, compact_caps, compact_profile_update
+from intents import classify
+import time
+from history import set_history, get_history, forget as forget_history
+from ingest import parse_stream, import_stream, text_stream, write_txns, clear_txns
+import analytics
+import ledger
+import forecast
+import goals
+import recurring
+import rollups
+import alerts
+import jobs
+import metrics
+import llm_cache
+from categorize import CATEGORY_KEYWORDS, infer_category, categorize_many, set_rule, list_rules, recategorize
+
+bp = Blueprint("fincoach", __name__)
+RULE_WAIT_SECONDS = float(os.getenv("RULE_WAIT_SECONDS", 5))
 
 PROFILE_FIELDS = [
     ("starting_balance","What’s your current account balance (₹)?","number"),
@@ -76,165 +61,97 @@ def ensure_sid():
         session["sid"] = str(uuid4())
     return session["sid"]
 
+def profile_rows(sid):
+    with db_for(sid) as conn:
+        return {r["key"]: r["value"] for r in conn.execute("SELECT key,value FROM profiles WHERE sid=?", (sid,))}
+
 def load_profile(sid):
-    with db() as conn:
-        rows = conn.execute("SELECT key,value FROM profiles WHERE sid=?", (sid,)).fetchall()
+    rows = read(sid, "profile", lambda: profile_rows(sid))
     out = {}
     t = {k:typ for (k,_,typ) in PROFILE_FIELDS}
-    for r in rows:
-        typ = t.get(r["key"], "text")
-        v = r["value"]
+    for key,v in list(rows.items()):
+        typ = t.get(key, "text")
         if typ == "number":
-            try: out[r["key"]] = float(str(v).replace(",",""))
-            except: out[r["key"]] = 0.0
+            try: out[key] = float(str(v).replace(",",""))
+            except: out[key] = 0.0
         elif typ == "boolean":
-            out[r["key"]] = str(v).lower() in ["yes","y","true","1"]
+            out[key] = str(v).lower() in ["yes","y","true","1"]
         else:
-            out[r["key"]] = v
+            out[key] = v
     return out
 
+# Inside a unit of work the write is queued and the memoized profile updated in place, so reads see it before commit.
 def save_profile_field(sid, key, value):
-    with db() as conn:
-        conn.execute("INSERT INTO profiles(sid,key,value) VALUES(?,?,?) ON CONFLICT(sid,key) DO UPDATE SET value=excluded.value", (sid, key, str(value)))
-        conn.commit()
-
-def set_history(sid, role, content):
-    with db() as conn:
-        conn.execute("INSERT INTO history(sid,role,content,ts) VALUES(?,?,?,?)", (sid, role, content, datetime.utcnow().isoformat()))
-        conn.commit()
-
-def get_history(sid, limit=80):
-    with db() as conn:
-        rows = conn.execute("SELECT role,content FROM history WHERE sid=? ORDER BY ts ASC",(sid,)).fetchall()
-    return [{"role":r["role"],"content":r["content"]} for r in rows][-limit:]
+    write(sid, "INSERT INTO profiles(sid,key,value) VALUES(?,?,?) ON CONFLICT(sid,key) DO UPDATE SET value=excluded.value", (sid, key, str(value)), bump=True)
+    if pending(sid): read(sid, "profile", lambda: profile_rows(sid))[key] = str(value)
 
 def clear_state(sid):
-    with db() as conn:
+    discard(sid)
+    with db_for(sid) as conn:
         conn.execute("DELETE FROM profiles WHERE sid=?", (sid,))
-        conn.execute("DELETE FROM txns WHERE sid=?", (sid,))
+        clear_txns(conn, sid)
         conn.execute("DELETE FROM history WHERE sid=?", (sid,))
+        conn.execute("DELETE FROM history_archive WHERE sid=?", (sid,))
         conn.execute("DELETE FROM caps WHERE sid=?", (sid,))
+        conn.execute("DELETE FROM category_rules WHERE sid=?", (sid,))
+        conn.execute("DELETE FROM turn_usage WHERE sid=?", (sid,))
+        conn.execute("DELETE FROM cap_events WHERE sid=?", (sid,))
+        bump_version(conn, sid)
         conn.commit()
+    forget_history(sid)
 
-def insert_txns(sid, rows):
-    with db() as conn:
-        conn.execute("DELETE FROM txns WHERE sid=?", (sid,))
-        for r in rows:
-            conn.execute("INSERT INTO txns(sid,date,description,amount,category) VALUES(?,?,?,?,?)", (sid, r["date"].isoformat(), r["description"], r["amount"], r["category"]))
+def insert_txns(sid, rows, mode="replace"):
+    with db_for(sid) as conn:
+        if mode == "replace": clear_txns(conn, sid)
+        out = write_txns(conn, sid, rows, mode)
+        bump_version(conn, sid)
         conn.commit()
-
-def get_txns(sid):
-    with db() as conn:
-        rows = conn.execute("SELECT date,description,amount,category FROM txns WHERE sid=? ORDER BY date ASC", (sid,)).fetchall()
-    out = []
-    for r in rows:
-        out.append({"date": datetime.fromisoformat(r["date"]).date(), "description": r["description"], "amount": float(r["amount"]), "category": r["category"]})
+    alerts.dispatch(out["alerts"])
     return out
 
+def get_txns(sid, days=None):
+    return ledger.load(sid, days)
+
 def set_cap(sid, category, weekly):
-    with db() as conn:
+    with db_for(sid) as conn:
         conn.execute("INSERT INTO caps(sid,category,weekly) VALUES(?,?,?) ON CONFLICT(sid,category) DO UPDATE SET weekly=excluded.weekly", (sid, category.lower(), float(weekly)))
+        bump_version(conn, sid)
         conn.commit()
+    forget_reads(sid, "caps")
 
 def set_caps_bulk(sid, items):
-    with db() as conn:
+    with db_for(sid) as conn:
         for it in items:
             conn.execute("INSERT INTO caps(sid,category,weekly) VALUES(?,?,?) ON CONFLICT(sid,category) DO UPDATE SET weekly=excluded.weekly", (sid, it["category"].lower(), float(it["weekly"])))
+        bump_version(conn, sid)
         conn.commit()
+    forget_reads(sid, "caps")
 
 def list_caps(sid):
-    with db() as conn:
-        rows = conn.execute("SELECT category,weekly FROM caps WHERE sid=?", (sid,)).fetchall()
-    return [{"category": r["category"], "weekly": float(r["weekly"])} for r in rows]
+    return [dict(c) for c in read(sid, "caps", lambda: caps_rows(sid))]
 
-def infer_category(desc, amount):
-    d = (desc or "").lower()
-    if amount > 0:
-        for cat,kws in CATEGORY_KEYWORDS.items():
-            if cat == "income" and any(k in d for k in kws):
-                return "income"
-        return "income"
-    for cat,kws in CATEGORY_KEYWORDS.items():
-        if cat == "income": continue
-        if any(k in d for k in kws):
-            return cat
-    if "rent" in d: return "rent"
-    return "other"
+def caps_rows(sid):
+    with db_for(sid) as conn:
+        rows = conn.execute("SELECT category,weekly FROM caps WHERE sid=? ORDER BY category", (sid,)).fetchall()
+    return [{"category": r["category"], "weekly": float(r["weekly"])} for r in rows]
 
 def parse_csv(text):
-    f = StringIO(text.strip())
-    reader = csv.DictReader(f)
-    rows = []
-    for r in reader:
-        date_str = r.get("date") or r.get("Date") or r.get("DATE") or ""
-        desc = r.get("description") or r.get("Description") or r.get("DESC") or r.get("narration") or ""
-        amt_str = r.get("amount") or r.get("Amount") or r.get("AMOUNT") or r.get("amt") or "0"
-        dt = None
-        for fmt in ("%Y-%m-%d","%d/%m/%Y","%d-%m-%Y","%m/%d/%Y"):
-            try:
-                dt = datetime.strptime(date_str.strip(), fmt).date(); break
-            except: pass
-        if not dt:
-            try: dt = datetime.fromisoformat(date_str.strip()).date()
-            except: continue
-        try: amount = float(str(amt_str).replace(",","").strip())
-        except: continue
-        rows.append({"date": dt, "description": desc.strip(), "amount": amount})
+    rows = list(parse_stream(StringIO(text.strip())))
     rows.sort(key=lambda x: x["date"])
     return rows
 
-def enrich_transactions(rows):
-    return [{**r, "category": infer_category(r["description"], r["amount"])} for r in rows]
-
-def detect_recurring(txns, min_occ=3):
-    def root(d):
-        p = (d or "").lower().split()
-        return " ".join(p[:2]) if p else ""
-    g = defaultdict(list)
-    for t in txns:
-        sign = "IN" if t["amount"] > 0 else "OUT"
-        g[(root(t["description"]),sign)].append(t["date"])
-    rec = {"income":[], "bills":[]}
-    for (k,sign),dates in g.items():
-        dates = sorted(dates)
-        if len(dates) < min_occ: continue
-        gaps = [(dates[i]-dates[i-1]).days for i in range(1,len(dates))]
-        if not gaps: continue
-        avg = mean(gaps)
-        if 20 <= avg <= 40:
-            amts = [t["amount"] for t in txns if (root(t["description"]), "IN" if t["amount"]>0 else "OUT")== (k,sign)]
-            amts.sort()
-            med = amts[len(amts)//2]
-            if sign=="IN": rec["income"].append({"name": k or "recurring income","amount": abs(med)})
-            else: rec["bills"].append({"name": k or "recurring bill","amount": abs(med)})
-    return rec
+def enrich_transactions(rows, sid=None, rules=None):
+    cats = categorize_many([r["description"] for r in rows], [r["amount"] for r in rows], sid, rules)
+    return [{**r, "category": c} for r,c in zip(rows, cats)]
+
+def detect_recurring(txns, min_occ=None):
+    return analytics.recurring(analytics.Columns(txns), min_occ)
 
 def summarize_cashflow(txns, horizon_days=28, starting_balance=0.0):
-    if not txns: return {"projected_min": starting_balance, "projected_end": starting_balance, "daily_avg": 0.0}
-    end = txns[-1]["date"]
-    start = end - timedelta(days=30)
-    daily = defaultdict(float)
-    for t in txns:
-        if t["date"] >= start: daily[t["date"]] += t["amount"]
-    if daily: avg = mean(daily.values())
-    else:
-        span = (txns[-1]["date"] - txns[0]["date"]).days + 1
-        avg = sum(t["amount"] for t in txns) / max(span,1)
-    bal = starting_balance
-    m = bal
-    for _ in range(horizon_days):
-        bal += avg
-        m = min(m, bal)
-    return {"projected_min": round(m,2), "projected_end": round(bal,2), "daily_avg": round(avg,2)}
+    return analytics.cashflow(analytics.Columns(txns), horizon_days, starting_balance)
 
 def category_spend(txns, days=30):
-    if not txns: return {}
-    end = txns[-1]["date"]; start = end - timedelta(days=days)
-    out = defaultdict(float)
-    for t in txns:
-        if t["date"] >= start and t["amount"] < 0:
-            out[t["category"]] += abs(t["amount"])
-    return dict(sorted(out.items(), key=lambda x:x[1], reverse=True))
+    return analytics.category_spend(analytics.Columns(txns), days)
 
 def currency(n):
     try:
@@ -242,42 +159,50 @@ def currency(n):
     except:
         return f"₹{n}"
 
-def make_recommendations_from_txns(txns, balance_hint=0.0, caps=None):
+def make_recommendations_from_txns(txns, balance_hint=0.0, caps=None, rec=None, weekly=None, history=None, first=None):
     if not txns: return make_recommendations_from_profile({})
-    inc = sum(t["amount"] for t in txns if t["amount"]>0)
-    exp = sum(-t["amount"] for t in txns if t["amount"]<0)
+    agg = analytics.summarize(txns, 28, balance_hint, rec, history, first)
+    inc, exp = agg["income"], agg["expense"]
     net = inc - exp
-    rec = detect_recurring(txns)
-    monthly_inc = sum(i["amount"] for i in rec["income"]) or max(inc,0.0)
-    monthly_bills = sum(b["amount"] for b in rec["bills"])
-    fc = summarize_cashflow(txns, 28, balance_hint)
-    cats_sorted = list(category_spend(txns,30).items())
+    rec = agg["recurring"]
+    monthly_inc = sum(recurring.monthly(i) for i in rec["income"]) or max(inc,0.0)
+    monthly_bills = sum(recurring.monthly(b) for b in rec["bills"])
+    fc = agg["cashflow"]
+    cats_sorted = list(agg["categories"].items())
     top3 = cats_sorted[:3]
     essential = monthly_bills if monthly_bills>0 else min(10000.0, exp)
     target_em = max(10000.0, round(essential*1.0,0))
     micro = max(300.0, round(0.1*(monthly_inc/4.0),0))
     actions = []
+    fix = None
     if fc["projected_min"] < 0:
-        actions.append({"title":"Shortfall risk in next 4 weeks","detail":f"Projected minimum balance dips by **{currency(abs(fc['projected_min']))}**.","cta":"Set weekly caps on top categories"})
+        fix = forecast.find_caps(agg["forecast"], balance_hint, 28)
+        when = "balance is already below zero" if balance_hint < 0 or fc["shortfall_day"] is None else f"first below zero on day {fc['shortfall_day']}"
+        detail = f"Projected minimum balance dips by **{currency(abs(fc['projected_min']))}** ({when})."
+        if fix and fix["feasible"]: detail += " Weekly caps that avoid it: " + ", ".join(f"{c} **{currency(v)}**" for c,v in fix["caps"].items()) + "."
+        actions.append({"title":"Shortfall risk in next 4 weeks","detail":detail,"cta":"Set weekly caps on top categories"})
+    top = []
     for c,a in top3:
-        cap = round(0.8*a/4.0,0)
+        cap = round(0.8*weekly[c]["weekly_avg"],0) if weekly and c in weekly else round(0.8*a/4.0,0)
         current = None
         if caps:
             for x in caps:
                 if x["category"] == c:
-                    current = x["weekly"]
+                    current = x
                     break
+        top.append({"category": c, "spent_30d": round(a,2), "suggested_weekly_cap": cap, "weekly_cap": current and current["weekly"], "spent_this_week": current and current.get("spent")})
         if current is None:
             actions.append({"title":f"Cap **{c}** spending","detail":f"Last 30 days: **{currency(a)}**. Suggested weekly cap: **{currency(cap)}**.","cta":f"Apply weekly cap for {c}"})
+        elif "spent" in current:
+            actions.append({"title":f"Weekly cap set: **{c}**","detail":f"This week: **{currency(current['spent'])}** of **{currency(current['weekly'])}**. Last 30 days: **{currency(a)}**.","cta":"Adjust cap if needed" if current["left"] >= 0 else f"Over by {currency(-current['left'])}; pause {c} spend"})
         else:
-            actions.append({"title":f"Weekly cap set: **{c}**","detail":f"Cap: **{currency(current)}**. Last 30 days: **{currency(a)}**.","cta":"Adjust cap if needed"})
+            actions.append({"title":f"Weekly cap set: **{c}**","detail":f"Cap: **{currency(current['weekly'])}**. Last 30 days: **{currency(a)}**.","cta":"Adjust cap if needed"})
     actions.append({"title":"Build your Emergency Fund","detail":f"Target at least **{currency(target_em)}** (≈ 1 month of essentials).","cta":f"Auto-save **{currency(micro)}** weekly"})
-    incomes = [t for t in txns if t["amount"]>0]
-    srcs = Counter([" ".join((t["description"] or "").lower().split()[:2]) for t in incomes])
-    if len(srcs)>1:
+    if agg["income_sources"]>1:
         actions.append({"title":"Income is variable","detail":"Multiple income sources detected. Maintain 10–15 days of average expenses as buffer.","cta":f"Increase buffer by {currency(1000)}–{currency(2000)} this week"})
     summary = f"**Overview**\n- Income: **{currency(inc)}**  |  Expense: **{currency(exp)}**  |  Net: **{currency(net)}**\n- Est. monthly income: **{currency(monthly_inc)}** | Bills: **{currency(monthly_bills)}**\n- 28-day forecast avg/day: **{currency(fc['daily_avg'])}** | Projected min: **{currency(fc['projected_min'])}**"
-    return {"summary": summary, "actions": actions, "top3": top3}
+    figures = {"basis": "transactions", "income": round(inc,2), "expense": round(exp,2), "net": round(net,2), "monthly_income": round(monthly_inc,2), "monthly_bills": round(monthly_bills,2), "daily_avg_28d": fc["daily_avg"], "projected_min_28d": fc["projected_min"], "shortfall_day": fc["shortfall_day"], "shortfall_caps": fix and fix["caps"], "emergency_target": target_em, "weekly_autosave": micro, "top_categories": top, "variable_income": agg["income_sources"]>1}
+    return {"summary": summary, "actions": actions, "top3": top3, "figures": figures}
 
 def make_recommendations_from_profile(p, caps=None):
     sb = float(p.get("starting_balance") or 0)
@@ -293,9 +218,8 @@ def make_recommendations_from_profile(p, caps=None):
     var_m = 4*(wf+wt+ws)
     net_m = inc - (bills + var_m + emi)
     avg = net_m/28.0 if inc else 0.0
-    bal = sb; m = bal
-    for _ in range(28):
-        bal += avg; m = min(m, bal)
+    # no dates in a profile, so the balance moves linearly and the minimum is at one end of the horizon
+    m = min(sb, sb + 28*avg)
     actions = []
     if m < 0:
         actions.append({"title":"Shortfall risk in next 4 weeks","detail":f"Projected min dips by **{currency(abs(m))}**. Reduce weekly variable spend by 15–25% and consider a small buffer transfer.","cta":"Apply 20% caps this month"})
@@ -317,24 +241,14 @@ def make_recommendations_from_profile(p, caps=None):
     actions.append({"title":"Emergency Fund first","detail":f"Keep at least **{currency(target_em)}** as 1 month of essentials.","cta":"Create bills/emergency envelope"})
     if has_debt and emi>0:
         actions.append({"title":"Debt payoff strategy","detail":f"Pay EMI on time; add a small extra payment ({currency(300)}–{currency(700)}) monthly if possible to reduce interest.","cta":"Set extra EMI reminder"})
+    figures = {"basis": "profile", "starting_balance": sb, "monthly_income": inc, "monthly_fixed_bills": bills, "monthly_variable": var_m, "monthly_emi": emi, "daily_avg_28d": round(avg,2), "projected_min_28d": round(m,2), "goal": gname, "goal_target": gtarget, "weekly_autosave": micro, "emergency_target": target_em, "suggested_weekly_caps": caps_suggest}
     summary = f"**Your Plan (profile-based)**\n- Starting balance: **{currency(sb)}**  |  Monthly income: **{currency(inc)}**\n- Fixed bills: **{currency(bills)}**  |  Variable/month (est): **{currency(var_m)}**  |  EMI: **{currency(emi)}**\n- 28-day forecast avg/day: **{currency(avg)}**  |  Projected min: **{currency(m)}**"
-    return {"summary": summary, "actions": actions}
+    return {"summary": summary, "actions": actions, "figures": figures}
 
 SYSTEM_PROMPT = """
-You are FinCoach, an Indian-rupee-focused financial coach with full conversational control. Always format money as ₹ with Indian-style thousand separators. Proactively lead the conversation to collect missing data and set budgets. Use tools to: get_state, set_profile_field, set_cap, set_caps_bulk, list_caps, analyze, reset_state, load_demo_data. If the user says “set weekly caps”, choose sensible categories and call the tools to save those caps. Prefer transaction-based analysis if transactions exist; otherwise use profile fields. Never invent numbers. Respond in clean Markdown with headings, bullets, and bold key figures. End with up to three clear next steps.
+You are FinCoach, an Indian-rupee-focused financial coach with full conversational control. Always format money as ₹ with Indian-style thousand separators. Proactively lead the conversation to collect missing data and set budgets. Use tools to: get_state, set_profile_field, set_cap, set_caps_bulk, list_caps, analyze, forecast, plan_goal, reset_state, load_demo_data, set_category_rule. If the user says “set weekly caps”, choose sensible categories and call the tools to save those caps. Prefer transaction-based analysis if transactions exist; otherwise use profile fields. Never invent numbers. Respond in clean Markdown with headings, bullets, and bold key figures. End with up to three clear next steps.
 """
 
-TOOLS = [
-    {"type":"function","function":{"name":"get_state","description":"Return current profile, missing fields, caps, and whether transactions exist.","parameters":{"type":"object","properties":{}}}},
-    {"type":"function","function":{"name":"set_profile_field","description":"Set or update one profile field.","parameters":{"type":"object","properties":{"field":{"type":"string"},"value":{"type":["string","number","boolean"]}},"required":["field","value"]}}},
-    {"type":"function","function":{"name":"set_cap","description":"Create or update a weekly spending cap for a category.","parameters":{"type":"object","properties":{"category":{"type":"string"},"weekly":{"type":"number"}},"required":["category","weekly"]}}},
-    {"type":"function","function":{"name":"set_caps_bulk","description":"Create or update multiple weekly caps.","parameters":{"type":"object","properties":{"items":{"type":"array","items":{"type":"object","properties":{"category":{"type":"string"},"weekly":{"type":"number"}},"required":["category","weekly"]}}},"required":["items"]}}},
-    {"type":"function","function":{"name":"list_caps","description":"List all active weekly caps.","parameters":{"type":"object","properties":{}}}},
-    {"type":"function","function":{"name":"analyze","description":"Analyze using transactions if present; else profile; include active caps.","parameters":{"type":"object","properties":{}}}},
-    {"type":"function","function":{"name":"reset_state","description":"Clear memory for this session.","parameters":{"type":"object","properties":{}}}},
-    {"type":"function","function":{"name":"load_demo_data","description":"Load built-in sample transactions for this session.","parameters":{"type":"object","properties":{}}}},
-]
-
 def profile_missing(profile):
     miss = []
     has_debt = str(profile.get("has_debt","")).lower()
@@ -344,14 +258,19 @@ def profile_missing(profile):
         if v in [None,""] or (typ=="number" and v==0): miss.append({"field":key,"prompt":prompt,"type":typ})
     return miss
 
+@tool("get_state", "Return current profile, missing fields, caps, and whether transactions exist.", read_only=True, compact=compact_state)
 def tool_get_state(sid):
+    # alerts change on ack without a version bump, so they are read fresh rather than cached
+    return {**cached("get_state", sid, data_version(sid), lambda: compute_state(sid)), "alerts": alerts.pending(sid, 5)}
+
+def compute_state(sid):
     prof = load_profile(sid)
     ms = profile_missing(prof)
-    tx = get_txns(sid)
     caps = list_caps(sid)
-    return {"profile": prof, "missing": ms, "has_transactions": bool(tx), "caps": caps}
+    return {"profile": prof, "missing": ms, "has_transactions": ledger.has_txns(sid), "caps": caps}
 
-def tool_set_profile_field(sid, field, value):
+@tool("set_profile_field", "Set or update one profile field.", {"field":{"type":"string"},"value":{"type":["string","number","boolean"]}}, ["field","value"], compact=compact_profile_update)
+def tool_set_profile_field(sid, field="", value=None):
     keys = [k for (k,_,_) in PROFILE_FIELDS]
     if field not in keys: return {"ok": False, "error": f"Unknown field {field}"}
     t = {k:typ for (k,_,typ) in PROFILE_FIELDS}.get(field, "text")
@@ -367,59 +286,214 @@ def tool_set_profile_field(sid, field, value):
         save_profile_field(sid, field, str(value))
     return {"ok": True, "profile": load_profile(sid)}
 
-def tool_set_cap(sid, category, weekly):
+@tool("set_cap", "Create or update a weekly spending cap for a category.", {"category":{"type":"string"},"weekly":{"type":"number"}}, ["category","weekly"], compact=compact_caps)
+def tool_set_cap(sid, category="", weekly=0):
     set_cap(sid, category, weekly)
     return {"ok": True, "caps": list_caps(sid)}
 
-def tool_set_caps_bulk(sid, items):
+@tool("set_caps_bulk", "Create or update multiple weekly caps.", {"items":{"type":"array","items":{"type":"object","properties":{"category":{"type":"string"},"weekly":{"type":"number"}},"required":["category","weekly"]}}}, ["items"], compact=compact_caps)
+def tool_set_caps_bulk(sid, items=()):
     set_caps_bulk(sid, items)
     return {"ok": True, "caps": list_caps(sid)}
 
+@tool("list_caps", "List all active weekly caps with spend so far in the current week.", read_only=True, compact=compact_caps)
 def tool_list_caps(sid):
-    return {"caps": list_caps(sid)}
+    week, caps = rollups.cap_status(sid)
+    return {"week": week, "caps": caps}
 
+@tool("analyze", "Analyze using transactions if present; else profile; include active caps.", read_only=True, compact=compact_analysis)
 def tool_analyze(sid):
+    return cached("analyze", sid, data_version(sid), lambda: compute_analysis(sid))
+
+def compute_analysis(sid):
     prof = load_profile(sid)
-    tx = get_txns(sid)
-    caps = list_caps(sid)
+    tx = get_txns(sid, forecast.WINDOW_DAYS)
     if tx:
-        return make_recommendations_from_txns(tx, balance_hint=float(prof.get("starting_balance") or 0), caps=caps)
-    return make_recommendations_from_profile(prof, caps=caps)
+        return make_recommendations_from_txns(tx, balance_hint=float(prof.get("starting_balance") or 0), caps=rollups.cap_status(sid)[1], rec=recurring.load(sid), weekly=rollups.trailing(sid, 4),
+                                              history=ledger.history_totals(sid), first=ledger.first_ordinal(sid))
+    return make_recommendations_from_profile(prof, caps=list_caps(sid))
+
+@tool("forecast", "Project the balance day by day from recurring income/bills and recent variable spend; reports the minimum, the first shortfall day and, if short, weekly caps that avoid it.", {"horizon_days":{"type":"integer","minimum":1,"maximum":forecast.MAX_HORIZON},"caps":{"type":"object","additionalProperties":{"type":"number"},"description":"category -> weekly cap to try"}}, read_only=True)
+def tool_forecast(sid, horizon_days=28, caps=None):
+    h = forecast.clamp(horizon_days)
+    base = cached(f"forecast:{h}", sid, data_version(sid), lambda: compute_forecast(sid, h))
+    if not caps or "error" in base: return base
+    model = forecast_inputs(sid)
+    return {**base, "with_caps": forecast.project(model, base["starting_balance"], h, {k.lower(): float(v) for k,v in caps.items()})}
+
+def forecast_inputs(sid):
+    return analytics.forecast_model(analytics.Columns(get_txns(sid, forecast.WINDOW_DAYS)), recurring.load(sid), ledger.first_ordinal(sid))
+
+def compute_forecast(sid, horizon):
+    if not ledger.has_txns(sid): return {"error": "no transactions; analyze uses the profile instead"}
+    sb = float(load_profile(sid).get("starting_balance") or 0)
+    model = forecast_inputs(sid)
+    saved = {c["category"]: c["weekly"] for c in list_caps(sid)}
+    out = {"horizon_days": horizon, "starting_balance": sb, **forecast.project(model, sb, horizon)}
+    if saved: out["with_saved_caps"] = forecast.project(model, sb, horizon, saved)
+    if out["shortfall_day"]: out["fix"] = forecast.find_caps(model, sb, horizon)
+    return out
+
+@tool("plan_goal", "Monte Carlo plan for the savings goal: replays past weeks of income and spend to estimate weeks to reach it and the chance of a negative balance under several save/cap plans. Pass weekly_save and/or caps to also test a plan of your own.", {"target":{"type":"number","description":"defaults to the profile goal_target"},"weekly_save":{"type":"number"},"caps":{"type":"object","additionalProperties":{"type":"number"},"description":"category -> weekly cap"},"weeks":{"type":"integer","minimum":4,"maximum":goals.MAX_WEEKS}}, read_only=True)
+def tool_plan_goal(sid, target=None, weekly_save=None, caps=None, weeks=52):
+    args = json.dumps([target, weekly_save, caps, weeks], sort_keys=True)
+    return cached(f"goal:{args}", sid, data_version(sid), lambda: compute_goal_plan(sid, target, weekly_save, caps, weeks))
 
+def compute_goal_plan(sid, target=None, weekly_save=None, caps=None, weeks=52):
+    if not ledger.has_txns(sid): return {"error": "no transactions; goal planning replays past weeks, so load a statement or sample data first"}
+    prof = load_profile(sid)
+    weeks = max(4, min(int(weeks), goals.MAX_WEEKS))
+    target = float(target or prof.get("goal_target") or 10000)
+    sb = float(prof.get("starting_balance") or 0)
+    first = ledger.first_ordinal(sid)
+    cols = analytics.Columns(get_txns(sid, goals.HISTORY_WEEKS * 7))
+    series, mask = analytics.recurring_series(cols, recurring.load(sid))
+    model = forecast.build(cols, series, mask, first=first)
+    income, spend = goals.weekly_history(cols, mask, first)
+    if len(income) < goals.MIN_HISTORY_WEEKS: return {"error": f"only {len(income)} whole weeks of transactions; goal planning needs at least {goals.MIN_HISTORY_WEEKS}"}
+    rec = goals.recurring_weekly(model, weeks)
+    weekly_income = float(income.mean()) + goals.recurring_income(model, weeks)
+    saved = {c["category"]: c["weekly"] for c in list_caps(sid)}
+    plans = goals.default_plans(weekly_income, spend, cols.cat_names, saved)
+    if weekly_save is not None or caps:
+        plans.append({"name": "custom", "weekly_save": float(weekly_save if weekly_save is not None else plans[0]["weekly_save"]), "caps": {**saved, **{k.lower(): float(v) for k,v in (caps or {}).items()}}})
+    out = goals.simulate(rec, income, spend, cols.cat_names, plans, sb, target, seed=goals.seed_for(sid, data_version(sid)))
+    return {"goal": (prof.get("goal_name") or "Emergency Fund").strip(), "target": target, "starting_balance": sb, "weeks": weeks, "paths": goals.PATHS,
+            "history_weeks": len(income), "weekly_income": round(weekly_income, 0), "plans": out}
+
+@tool("reset_state", "Clear memory for this session.")
 def tool_reset_state(sid):
     clear_state(sid)
     return {"ok": True}
 
+@tool("load_demo_data", "Load built-in sample transactions for this session.")
 def tool_load_demo_data(sid):
-    rows = enrich_transactions(parse_csv(DEMO_CSV))
+    rows = enrich_transactions(parse_csv(DEMO_CSV), sid)
     insert_txns(sid, rows)
+    jobs.submit(sid, "precompute")
     return {"ok": True, "count": len(rows)}
 
+@tool("set_category_rule", "Always file transactions whose description contains a merchant/keyword under a category; re-categorizes existing transactions.", {"pattern":{"type":"string"},"category":{"type":"string"}}, ["pattern","category"])
+def tool_set_category_rule(sid, pattern="", category=""):
+    if not (pattern or "").strip() or not (category or "").strip(): return {"ok": False, "error": "pattern and category are required"}
+    set_rule(sid, pattern, category)
+    j = jobs.wait(jobs.submit(sid, "recategorize"), RULE_WAIT_SECONDS)
+    if j["status"] == "done": return {"ok": True, "rules": list_rules(sid), **j["result"]}
+    return {"ok": True, "rules": list_rules(sid), "job": j["id"], "status": j["status"]}
+
+# Heavy per-session work; runs on the job pool so the request that triggered it can return at once.
+@jobs.job("precompute")
+def job_precompute(sid):
+    tool_get_state(sid)
+    tool_analyze(sid)
+    return {"version": data_version(sid)}
+
+@jobs.job("load_demo")
+def job_load_demo(sid):
+    out = tool_load_demo_data(sid)
+    set_history(sid,"assistant",f"Sample data loaded ✅ ({out['count']} transactions). I can analyze it now.")
+    return out
+
+@jobs.job("recategorize")
+def job_recategorize(sid):
+    n = recategorize(sid)
+    jobs.submit(sid, "precompute")
+    return {"recategorized": n}
+
+TOOLS = tool_schemas()
+
+def render_analysis(out):
+    lines = [out["summary"], "", "**Recommendations**"]
+    for a in out["actions"]:
+        lines.append(f"- {a['title']}: {a['detail']} → {a['cta']}")
+    return "\n".join(lines)
+
+def suggested_caps(out):
+    fig = out["figures"]
+    if fig["basis"] == "transactions":
+        return [{"category": t["category"], "weekly": t["suggested_weekly_cap"]} for t in fig["top_categories"] if t["suggested_weekly_cap"] > 0]
+    return [{"category": k, "weekly": v} for k,v in fig["suggested_weekly_caps"].items() if v > 0]
+
+def reply_advice(sid):
+    out = tool_analyze(sid)
+    text = render_analysis(out)
+    if any(t["weekly_cap"] is None for t in out["figures"].get("top_categories", [])):
+        text += "\n\nSay **Set weekly caps** to apply the suggested caps."
+    return text
+
+def reply_set_caps(sid):
+    items = suggested_caps(tool_analyze(sid))
+    if not items: return None
+    caps = tool_set_caps_bulk(sid, items)["caps"]
+    lines = ["**Weekly caps saved** ✅"] + [f"- {c['category']}: **{currency(c['weekly'])}**" for c in caps]
+    return "\n".join(lines + ["", "Ask for **Advice** anytime to see spending against these caps."])
+
+def reply_list_caps(sid):
+    week, caps = rollups.cap_status(sid)
+    if not caps: return "No weekly caps yet. Say **Set weekly caps** and I’ll suggest and save some."
+    return "\n".join([f"**Your weekly caps** ({week})"] + [f"- {c['category']}: **{currency(c['spent'])}** of **{currency(c['weekly'])}**" for c in caps])
+
+def reply_sample(sid):
+    n = tool_load_demo_data(sid)["count"]
+    return f"Sample data loaded ✅ ({n} transactions). Type **Advice** or **Set weekly caps**."
+
+def reply_reset(sid):
+    tool_reset_state(sid)
+    return "Session cleared ✅. " + WELCOME
+
+INTENT_HANDLERS = {"advice": reply_advice, "set_caps": reply_set_caps, "list_caps": reply_list_caps, "sample": reply_sample, "reset": reply_reset}
+
+def begin_turn(sid, user_text, load_sample=True):
+    if load_sample and re.search(r"\bsample\b", user_text.lower()):
+        tool_load_demo_data(sid)
+    hist = get_history(sid,80)
+    set_history(sid,"user",user_text)
+    return build_messages(SYSTEM_PROMPT, hist, user_text)
+
+# Recognized commands are answered from local analysis; only unrecognized text reaches the model.
+def local_reply(sid, intent):
+    t0 = time.perf_counter()
+    reply = INTENT_HANDLERS[intent](sid)
+    if reply is None: return None, None
+    return reply, {"intent": intent, "iterations": 0, "tools": [], "hops": [], "tokens": {"prompt": 0, "completion": 0}, "seconds": round(time.perf_counter() - t0, 3)}
+
+def turn_events(sid, user_text):
+    jobs.wait_idle(sid, TURN_BUDGET)
+    intent = classify(user_text)
+    msgs = begin_turn(sid, user_text, load_sample=intent is None)
+    if intent:
+        reply, turn = local_reply(sid, intent)
+        if reply is not None:
+            set_history(sid,"assistant",reply)
+            record_usage(sid, turn)
+            yield "metrics", turn
+            yield "done", reply
+            return
+    if not llm_enabled():
+        reply = "LLM is disabled (missing OPENAI_API_KEY). I can still handle **Advice**, **Set weekly caps**, **Show my caps**, **Sample data** and **Reset**."
+        set_history(sid,"assistant",reply)
+        yield "done", reply
+        return
+    for kind,val in run_turn(sid, msgs):
+        if kind == "done": set_history(sid,"assistant",val)
+        elif kind == "metrics": record_usage(sid, val)
+        yield kind, val
+
+def record_usage(sid, turn):
+    write(sid, "INSERT INTO turn_usage(sid,ts,iterations,prompt_tokens,completion_tokens,seconds) VALUES(?,?,?,?,?,?)", (sid, datetime.utcnow().isoformat(), turn["iterations"], turn["tokens"]["prompt"], turn["tokens"]["completion"], turn["seconds"]))
+
+def conversation_usage(sid):
+    with db_for(sid) as conn:
+        r = conn.execute("SELECT COUNT(*) AS turns, COALESCE(SUM(prompt_tokens),0) AS prompt, COALESCE(SUM(completion_tokens),0) AS completion, COALESCE(SUM(seconds),0) AS seconds FROM turn_usage WHERE sid=?", (sid,)).fetchone()
+    return {"turns": r["turns"], "prompt_tokens": r["prompt"], "completion_tokens": r["completion"], "seconds": round(r["seconds"],3)}
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def run_llm(sid, user_text):
-    msgs = [{"role":"system","content": SYSTEM_PROMPT}]
-    for m in get_history(sid,80): msgs.append(m)
-    msgs.append({"role":"user","content": user_text})
-    for _ in range(10):
-        resp = openai.chat.completions.create(model="gpt-4o-mini", messages=msgs, tools=TOOLS, temperature=0.2)
-        msg = resp.choices[0].message
-        if msg.tool_calls:
-            for tc in msg.tool_calls:
-                name = tc.function.name
-                args = json.loads(tc.function.arguments or "{}")
-                if name=="get_state": out = tool_get_state(sid)
-                elif name=="set_profile_field": out = tool_set_profile_field(sid, args.get("field",""), args.get("value"))
-                elif name=="set_cap": out = tool_set_cap(sid, args.get("category",""), args.get("weekly",0))
-                elif name=="set_caps_bulk": out = tool_set_caps_bulk(sid, args.get("items",[]))
-                elif name=="list_caps": out = tool_list_caps(sid)
-                elif name=="analyze": out = tool_analyze(sid)
-                elif name=="reset_state": out = tool_reset_state(sid)
-                elif name=="load_demo_data": out = tool_load_demo_data(sid)
-                else: out = {"error":"unknown tool"}
-                msgs.append({"role":"assistant","tool_calls":[tc]})
-                msgs.append({"role":"tool","tool_call_id": tc.id, "content": json.dumps(out)})
-            continue
-        return msg.content or "…"
-    return "Updated. Ask for **Advice** or say **Start** to continue."
+    msgs = build_messages(SYSTEM_PROMPT, get_history(sid,80), user_text)
+    for kind,val in run_turn(sid, msgs):
+        if kind == "done": return val
 
 INDEX_HTML = """
 <!doctype html>
@@ -488,6 +562,8 @@ linear-gradient(180deg,#0B0B0C,#0A0A0B);color:var(--ink);font-family:Inter,ui-sa
     <div class="brand">FinCoach</div>
     <div class="actions">
       <button class="btn primary" id="demo">Use Sample Data</button>
+      <button class="btn" id="upload">Upload CSV</button>
+      <input type="file" id="file" accept=".csv,text/csv" style="display:none"/>
       <button class="btn" id="reset">Reset</button>
     </div>
   </div>
@@ -541,8 +617,22 @@ async function init(){
 }
 async function ask(text){
   bubble('user',text);msg.value='';typing.style.display='block'
-  const r=await fetch('/chat',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({text})})
-  const d=await r.json();typing.style.display='none';bubble('bot',d.text)
+  const r=await fetch('/chat/stream',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({text})})
+  const reader=r.body.getReader(),dec=new TextDecoder()
+  let buf='',acc='',b=null
+  const show=t=>{if(!b){typing.style.display='none';bubble('bot','');b=chat.lastChild.querySelector('.bub')}b.innerHTML=md(t);chat.scrollTop=chat.scrollHeight}
+  while(true){
+    const {value,done}=await reader.read();if(done)break
+    buf+=dec.decode(value,{stream:true})
+    let i
+    while((i=buf.indexOf('\\n\\n'))>=0){
+      const ev=buf.slice(0,i);buf=buf.slice(i+2)
+      const kind=(ev.match(/^event: (.*)$/m)||[])[1],data=JSON.parse((ev.match(/^data: (.*)$/m)||[])[1]||'{}')
+      if(kind==='delta'){acc+=data.text;show(acc)}
+      else if(kind==='done'||kind==='error'){show(data.text)}
+    }
+  }
+  typing.style.display='none'
 }
 sendBtn.onclick=()=>{const t=(msg.value||'').trim();if(!t)return;ask(t)}
 msg.addEventListener('keydown',e=>{if(e.key==='Enter'&&!e.shiftKey){e.preventDefault();sendBtn.click()}})
@@ -560,11 +650,33 @@ demoBtn.onclick=async()=>{
   typing.style.display='block'
   const r=await fetch('/demo',{method:'POST'})
   const d=await r.json()
-  typing.style.display='none'
   bubble('bot',d.text)
+  const j=await waitJob(d.job)
+  typing.style.display='none'
+  if(!j||j.status==='failed'){bubble('bot','Sample data could not be loaded'+(j&&j.error?': '+j.error:'')+'. Try again.');return}
+  if(j.status!=='done'){bubble('bot','Sample data is still loading. Ask for **Advice** in a moment.');return}
+  bubble('bot','Sample data loaded ✅ ('+j.result.count+' transactions). I’ll run an analysis next.')
   showToast('Sample data added to your session')
   setTimeout(()=>{msg.value="Advice";sendBtn.click()},380)
 }
+async function waitJob(id,timeout=30000){
+  const end=Date.now()+timeout
+  while(true){
+    const r=await fetch('/jobs/'+id);if(!r.ok)return null
+    const j=await r.json();if(j.status==='done'||j.status==='failed'||Date.now()>=end)return j
+    await new Promise(res=>setTimeout(res,300))
+  }
+}
+const fileIn=document.getElementById('file')
+document.getElementById('upload').onclick=()=>fileIn.click()
+fileIn.onchange=async()=>{
+  const f=fileIn.files[0];if(!f)return
+  const fd=new FormData();fd.append('file',f)
+  bubble('user','Upload '+f.name);typing.style.display='block'
+  const r=await fetch('/upload',{method:'POST',body:fd})
+  const d=await r.json();typing.style.display='none';fileIn.value=''
+  bubble('bot',d.text||('Import failed: '+d.error))
+}
 resetBtn.onclick=async()=>{await fetch('/reset',{method:'POST'});chat.innerHTML='';showToast('Session cleared');init()}
 init()
 </script>
@@ -574,72 +686,162 @@ init()
 
 WELCOME = "Hi! I’m **FinCoach**. I’ll ask a few quick questions to tailor advice in **₹**. You can tap **Use Sample Data** for an instant demo. Shall we begin?"
 
-@app.route("/")
+# The page has no template variables, so it is encoded and gzipped once per process and revalidated by ETag.
+@lru_cache(maxsize=1)
+def index_page():
+    raw = INDEX_HTML.encode("utf-8")
+    return raw, gzip.compress(raw, 6), hashlib.sha1(raw).hexdigest()[:16]
+
+@bp.route("/")
 def index():
     ensure_sid()
-    return render_template_string(INDEX_HTML)
+    raw, gz, etag = index_page()
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    if "gzip" in request.accept_encodings:
+        return Response(gz, mimetype="text/html", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(raw, mimetype="text/html", headers=headers)
+
+@bp.before_app_request
+def start_request():
+    metrics.begin_request()
+    g.t0 = time.perf_counter()
+    g.profile = metrics.start_profile()
+
+# A streamed body is produced after this hook returns, so its latency and profile are closed out when the server
+# closes the response; its spans go out as the stream's last event instead of a Server-Timing header.
+@bp.after_app_request
+def finish_request(resp):
+    t0, profile, status = g.t0, g.profile, resp.status_code
+    endpoint = (request.endpoint or "unknown").rpartition(".")[2]
+    def finish():
+        dt = time.perf_counter() - t0
+        if profile: metrics.stop_profile(profile, endpoint)
+        metrics.observe("fincoach_http_request_seconds", dt, endpoint=endpoint, status=status)
+        return dt
+    if resp.is_streamed:
+        resp.call_on_close(finish)
+        return resp
+    dt = finish()
+    spans = metrics.request_spans()
+    resp.headers["Server-Timing"] = metrics.server_timing(spans) + (", " if spans else "") + f"total;dur={dt*1000:.1f}"
+    return resp
+
+@bp.route("/metrics")
+def metrics_route():
+    for k,v in analysis_cache.stats().items(): metrics.gauge(f"fincoach_analysis_cache_{k}", v)
+    for k,v in llm_cache.stats().items():
+        if k != "mode": metrics.gauge(f"fincoach_llm_cache_{k}", v)
+    with db() as conn:
+        n = dict(conn.execute("SELECT status,COUNT(*) FROM jobs GROUP BY status").fetchall())
+    for st in ("queued","running","done","failed"): metrics.gauge("fincoach_jobs", n.get(st, 0), status=st)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-@app.route("/init")
+@bp.route("/init")
 def init():
     sid = ensure_sid()
     if not get_history(sid):
         set_history(sid,"assistant",WELCOME)
     return jsonify({"text": WELCOME})
 
-@app.route("/reset", methods=["POST"])
+@bp.route("/alerts")
+def cap_alerts():
+    sid = ensure_sid()
+    out = alerts.pending(sid)
+    alerts.ack(sid, [e["id"] for e in out])
+    return jsonify({"alerts": out})
+
+@bp.route("/usage")
+def usage():
+    return jsonify(conversation_usage(ensure_sid()))
+
+@bp.route("/reset", methods=["POST"])
 def reset():
     sid = ensure_sid()
     clear_state(sid)
     return jsonify({"ok": True})
 
-@app.route("/demo", methods=["POST"])
+@bp.route("/demo", methods=["POST"])
 def demo():
     sid = ensure_sid()
-    tool_load_demo_data(sid)
-    set_history(sid,"assistant","Sample data loaded ✅. I can analyze it now.")
-    return jsonify({"text":"Sample data loaded ✅. I’ll run an analysis next. Type **Advice** or **Set weekly caps**."})
+    jid = jobs.submit(sid, "load_demo")
+    return jsonify({"text":"Loading sample data…", "job": jid}), 202
 
-@app.route("/chat", methods=["POST"])
+@bp.route("/upload", methods=["POST"])
+def upload():
+    sid = ensure_sid()
+    f = request.files.get("file")
+    mode = "replace" if request.args.get("mode") == "replace" else "merge"
+    rules = list_rules(sid)
+    stats = import_stream(sid, text_stream(f.stream if f else request.stream), lambda rows: enrich_transactions(rows, rules=rules), mode)
+    if "error" in stats:
+        return jsonify({"ok": False, "error": stats["error"], "stats": stats}), 400
+    text = f"Statement imported ✅ ({stats['inserted']} new, {stats['skipped']} already present, {stats['rejected']} rejected). Type **Advice** to analyze it."
+    set_history(sid,"assistant",text)
+    return jsonify({"ok": True, "text": text, "stats": stats, "job": jobs.submit(sid, "precompute")})
+
+@bp.route("/jobs")
+def job_list():
+    return jsonify({"jobs": jobs.list_jobs(ensure_sid())})
+
+@bp.route("/jobs/<int:jid>")
+def job_status(jid):
+    j = jobs.status(jid, ensure_sid())
+    if j is None: return jsonify({"error": "not found"}), 404
+    return jsonify(j)
+
+@bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    sid = ensure_sid()
+    data = request.get_json(silent=True) or {}
+    user_text = (data.get("text") or "hi").strip()
+    def gen():
+        t0 = time.perf_counter()
+        try:
+            with unit_of_work(sid):
+                for kind,val in turn_events(sid, user_text):
+                    yield sse(kind, val if kind == "metrics" else {"name": val} if kind == "tool" else {"text": val})
+        except Exception as e:
+            yield sse("error", {"text": f"Something went wrong talking to the model ({type(e).__name__}). Please try again."})
+        spans = metrics.request_spans()
+        yield sse("timing", {"server_timing": metrics.server_timing(spans) + (", " if spans else "") + f"stream;dur={(time.perf_counter() - t0)*1000:.1f}"})
+    return Response(gen(), mimetype="text/event-stream", headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
+
+@bp.route("/chat", methods=["POST"])
 def chat_route():
     sid = ensure_sid()
     data = request.get_json(silent=True) or {}
     user_text = (data.get("text") or "hi").strip()
-    if re.search(r"\bsample\b", user_text.lower()):
-        tool_load_demo_data(sid)
-    set_history(sid,"user",user_text)
-    if not openai.api_key:
-        reply = "LLM is disabled (missing OPENAI_API_KEY). Use **Sample Data**, then type **Advice** for a fixed analysis."
-        set_history(sid,"assistant",reply)
-        return jsonify({"text": reply})
-    msgs = [{"role":"system","content": SYSTEM_PROMPT}]
-    for m in get_history(sid,80): msgs.append(m)
-    msgs.append({"role":"user","content": user_text})
-    for _ in range(10):
-        resp = openai.chat.completions.create(model="gpt-4o-mini", messages=msgs, tools=TOOLS, temperature=0.2)
-        msg = resp.choices[0].message
-        if msg.tool_calls:
-            for tc in msg.tool_calls:
-                name = tc.function.name
-                args = json.loads(tc.function.arguments or "{}")
-                if name=="get_state": out = tool_get_state(sid)
-                elif name=="set_profile_field": out = tool_set_profile_field(sid, args.get("field",""), args.get("value"))
-                elif name=="set_cap": out = tool_set_cap(sid, args.get("category",""), args.get("weekly",0))
-                elif name=="set_caps_bulk": out = tool_set_caps_bulk(sid, args.get("items",[]))
-                elif name=="list_caps": out = tool_list_caps(sid)
-                elif name=="analyze": out = tool_analyze(sid)
-                elif name=="reset_state": out = tool_reset_state(sid)
-                elif name=="load_demo_data": out = tool_load_demo_data(sid)
-                else: out = {"error":"unknown tool"}
-                msgs.append({"role":"assistant","tool_calls":[tc]})
-                msgs.append({"role":"tool","tool_call_id": tc.id, "content": json.dumps(out)})
-            continue
-        out_text = (msg.content or "…").replace("₦","₹")
-        set_history(sid,"assistant",out_text)
-        return jsonify({"text": out_text})
-    out_text = "Updated. Ask for **Advice** or say **Start** to continue."
-    set_history(sid,"assistant",out_text)
-    return jsonify({"text": out_text})
+    with unit_of_work(sid):
+        for kind,val in turn_events(sid, user_text):
+            if kind == "done": return jsonify({"text": val})
+
+DEV_SECRET_KEY = "fincoach-dev-only"
+
+# Migrations run on a process's first connection; run `python storage.py` at deploy time and start workers
+# with FINCOACH_MIGRATE=off to skip the check. Job recovery is left to processes that serve the app.
+# FLASK_SECRET_KEY signs the session cookie, so every worker and node must share it; only the single-process
+# dev server (`python main.py`, dev=True) falls back to DEV_SECRET_KEY.
+def create_app(dev=False):
+    app = Flask(__name__)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY")
+    if not app.secret_key:
+        if not dev: raise RuntimeError("FLASK_SECRET_KEY is not set; every worker serving the app needs the same key")
+        app.secret_key = DEV_SECRET_KEY
+        app.logger.warning("FLASK_SECRET_KEY is not set; using the dev-only key")
+    app.register_blueprint(bp)
+    jobs.recover()
+    return app
+
+# `main.app` (what WSGI servers look up) builds the app on first access; importing main for its helpers does not.
+def __getattr__(name):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+    create_app(dev=True).run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
 
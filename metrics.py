@@ -0,0 +1,144 @@
+import os, time, sqlite3, threading, cProfile
+from collections import defaultdict
+from contextvars import ContextVar
+from contextlib import contextmanager
+
+# In-process counters and histograms rendered in the Prometheus text format, plus per-request spans.
+# Recording is a perf_counter pair and a dict update under one lock, cheap enough to leave on.
+
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_EVERY = int(os.getenv("PROFILE_EVERY", 0))   # profile one request in N; 0 disables
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = 20
+
+HELP = {
+    "fincoach_http_request_seconds": ("histogram", "HTTP request latency by endpoint"),
+    "fincoach_db_query_seconds": ("histogram", "SQLite statement latency by verb"),
+    "fincoach_tool_seconds": ("histogram", "Tool execution latency"),
+    "fincoach_tool_errors_total": ("counter", "Tool calls that returned an error"),
+    "fincoach_tool_output_bytes_total": ("counter", "Bytes of tool output sent to the model"),
+    "fincoach_model_seconds": ("histogram", "Model round trip latency by source (api or cache)"),
+    "fincoach_model_tokens_total": ("counter", "Model tokens by kind"),
+    "fincoach_turn_iterations": ("histogram", "Tool-loop iterations per chat turn"),
+    "fincoach_turn_seconds": ("histogram", "Chat turn latency"),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_hists = {}
+_gauges = {}
+_spans = ContextVar("fincoach_spans", default=None)
+_requests = 0
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1.0, **labels):
+    with _lock: _counters[_key(name, labels)] += value
+
+def gauge(name, value, **labels):
+    with _lock: _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    k = _key(name, labels)
+    with _lock:
+        h = _hists.get(k)
+        if h is None: h = _hists[k] = [0] * len(BUCKETS) + [0.0, 0]
+        for i,b in enumerate(BUCKETS):
+            if value <= b:
+                h[i] += 1
+                break
+        h[-2] += value; h[-1] += 1
+
+def span(kind, seconds):
+    s = _spans.get()
+    if s is not None:
+        a = s[kind]; a[0] += 1; a[1] += seconds
+
+@contextmanager
+def timed(name, span_kind=None, **labels):
+    t0 = time.perf_counter()
+    try: yield
+    finally:
+        dt = time.perf_counter() - t0
+        observe(name, dt, **labels)
+        if span_kind: span(span_kind, dt)
+
+def begin_request():
+    _spans.set(defaultdict(lambda: [0, 0.0]))
+
+def request_spans():
+    return _spans.get() or {}
+
+def server_timing(spans):
+    return ", ".join(f'{k};dur={v[1]*1000:.1f};desc="{v[0]}"' for k,v in spans.items())
+
+class TimedConnection(sqlite3.Connection):
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try: return super().execute(sql, params)
+        finally: query(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        try: return super().executemany(sql, seq)
+        finally: query(sql, time.perf_counter() - t0)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try: return super().commit()
+        finally: query("COMMIT", time.perf_counter() - t0)
+
+def query(sql, dt):
+    observe("fincoach_db_query_seconds", dt, verb=sql.lstrip()[:6].split(None, 1)[0].upper() if sql.strip() else "")
+    span("db", dt)
+
+# Sampled profiler: start_profile returns a Profile for one request in PROFILE_EVERY, stop_profile dumps it.
+def start_profile():
+    global _requests
+    if not PROFILE_EVERY: return None
+    with _lock:
+        _requests += 1
+        if _requests % PROFILE_EVERY: return None
+    p = cProfile.Profile()
+    p.enable()
+    return p
+
+def stop_profile(p, name):
+    p.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    p.dump_stats(os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{name}.prof"))
+    old = sorted(os.listdir(PROFILE_DIR))[:-PROFILE_KEEP]
+    for f in old: os.remove(os.path.join(PROFILE_DIR, f))
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k,v in items) + "}"
+
+def render():
+    with _lock:
+        counters, hists, gauges = dict(_counters), {k: list(v) for k,v in _hists.items()}, dict(_gauges)
+    out, seen = [], set()
+    def head(name, typ):
+        if name in seen: return
+        seen.add(name)
+        if name in HELP: out.append(f"# HELP {name} {HELP[name][1]}")
+        out.append(f"# TYPE {name} {typ}")
+    for (name,labels),v in sorted(counters.items()):
+        head(name, "counter"); out.append(f"{name}{_labels(labels)} {v:g}")
+    for (name,labels),v in sorted(gauges.items()):
+        head(name, "gauge"); out.append(f"{name}{_labels(labels)} {v:g}")
+    for (name,labels),h in sorted(hists.items()):
+        head(name, "histogram")
+        acc = 0
+        for b,c in zip(BUCKETS, h):
+            acc += c
+            out.append(f"{name}_bucket{_labels(labels, [('le', f'{b:g}')])} {acc}")
+        out.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {h[-1]}")
+        out.append(f"{name}_sum{_labels(labels)} {h[-2]:.6f}")
+        out.append(f"{name}_count{_labels(labels)} {h[-1]}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,148 @@
+import os, time, threading
+from functools import lru_cache
+import metrics
+
+# PostgreSQL backend (FINCOACH_DATABASE_URL=postgresql://...). psycopg is only imported when it is selected.
+# Statements are the same ones the SQLite backend runs; PgConnection rewrites ? placeholders and gives rows
+# sqlite3.Row's by-index and by-name access, so every node can share one database and its writers.
+
+# Each entry upgrades the schema by one version; fincoach_schema records how far the database has got.
+MIGRATIONS = [
+    [
+        "CREATE TABLE IF NOT EXISTS profiles (sid TEXT, key TEXT, value TEXT, PRIMARY KEY (sid,key))",
+        "CREATE TABLE IF NOT EXISTS txns (sid TEXT, date TEXT, description TEXT, amount DOUBLE PRECISION, category TEXT, hash TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_txns_sid_date ON txns(sid,date)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_txns_sid_hash ON txns(sid,hash)",
+        "CREATE TABLE IF NOT EXISTS history (seq BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, sid TEXT, role TEXT, content TEXT, ts TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_history_sid_seq ON history(sid,seq)",
+        "CREATE TABLE IF NOT EXISTS history_archive (sid TEXT, seq_from BIGINT, seq_to BIGINT, ts_from TEXT, ts_to TEXT, turns INTEGER, summary TEXT, body TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_history_archive_sid ON history_archive(sid,seq_to)",
+        "CREATE TABLE IF NOT EXISTS caps (sid TEXT, category TEXT, weekly DOUBLE PRECISION, PRIMARY KEY (sid,category))",
+        "CREATE TABLE IF NOT EXISTS category_rules (sid TEXT, pattern TEXT, category TEXT, PRIMARY KEY (sid,pattern))",
+        "CREATE TABLE IF NOT EXISTS data_versions (sid TEXT PRIMARY KEY, version BIGINT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS turn_usage (sid TEXT, ts TEXT, iterations INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, seconds DOUBLE PRECISION)",
+        "CREATE INDEX IF NOT EXISTS idx_turn_usage_sid ON turn_usage(sid,ts)",
+        "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, bytes INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, seconds DOUBLE PRECISION, created TEXT, last_used TEXT, hits INTEGER)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)",
+        "CREATE TABLE IF NOT EXISTS recurring_state (sid TEXT, merchant TEXT, kind TEXT, tail TEXT, count INTEGER, first INTEGER, last INTEGER, period TEXT, every_days DOUBLE PRECISION, amount DOUBLE PRECISION, PRIMARY KEY(sid, merchant, kind))",
+        "CREATE TABLE IF NOT EXISTS rollups (sid TEXT, week TEXT, category TEXT, total DOUBLE PRECISION NOT NULL, count INTEGER NOT NULL, PRIMARY KEY(sid, week, category))",
+        "CREATE TABLE IF NOT EXISTS cap_events (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, sid TEXT, ts TEXT, week TEXT, category TEXT, level TEXT, spent DOUBLE PRECISION, weekly DOUBLE PRECISION, seen INTEGER NOT NULL DEFAULT 0, UNIQUE(sid, week, category, level))",
+        "CREATE INDEX IF NOT EXISTS idx_cap_events_sid_seen ON cap_events(sid, seen, id)",
+        "CREATE TABLE IF NOT EXISTS jobs (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, sid TEXT, kind TEXT, args TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, run_after DOUBLE PRECISION NOT NULL DEFAULT 0, result TEXT, error TEXT, created TEXT, started TEXT, finished TEXT)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_sid ON jobs(sid, status)",
+        "CREATE TABLE IF NOT EXISTS report_runs (run TEXT PRIMARY KEY, started TEXT, finished TEXT, total INTEGER, done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS reports (run TEXT, sid TEXT, ts TEXT, version BIGINT, status TEXT, result TEXT, PRIMARY KEY(run, sid))",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_txns_sid_amount ON txns(sid,amount,description)",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+LOCK_ID = 0x66696e63   # advisory lock held while migrating, so nodes starting together migrate once
+
+class Row(tuple):
+    def __new__(cls, values, index):
+        r = tuple.__new__(cls, values)
+        r._index = index
+        return r
+
+    def __getitem__(self, k):
+        return tuple.__getitem__(self, self._index[k] if isinstance(k, str) else k)
+
+    def keys(self):
+        return list(self._index)
+
+def _rows(cur):
+    index = {c.name: i for i,c in enumerate(cur.description or ())}
+    return lambda values: Row(values, index)
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    return sql.replace("%", "%%").replace("?", "%s")
+
+class PgConnection:
+    def __init__(self, url):
+        import psycopg
+        from psycopg.types.numeric import FloatLoader
+        self.raw = psycopg.connect(url, row_factory=_rows, client_encoding="utf8")
+        self.raw.adapters.register_loader("numeric", FloatLoader)   # SUM over integers comes back as numeric
+
+    def execute(self, sql, args=()):
+        t0 = time.perf_counter()
+        try: return self.raw.execute(translate(sql), tuple(args))
+        finally: metrics.query(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        cur = self.raw.cursor()
+        try:
+            seq = [tuple(a) for a in seq]
+            if seq: cur.executemany(translate(sql), seq)
+            return cur
+        finally: metrics.query(sql, time.perf_counter() - t0)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try: self.raw.commit()
+        finally: metrics.query("COMMIT", time.perf_counter() - t0)
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, *exc):
+        if typ is None: self.commit()
+        else: self.rollback()
+        return False
+
+class PostgresBackend:
+    def __init__(self, url):
+        self.url = url
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._migrated = False
+
+    def connect(self, part=None):
+        c = getattr(self._local, "conn", None)
+        if c is None or self._local.pid != os.getpid() or c.raw.closed:
+            c = self._local.conn = PgConnection(self.url)
+            self._local.pid = os.getpid()
+        if not self._migrated:
+            with self._lock:
+                if not self._migrated: self.migrate(c)
+                self._migrated = True
+        return c
+
+    def part(self, sid):
+        return None
+
+    def parts(self):
+        return [None]
+
+    def version(self, part=None):
+        with self.connect() as conn:
+            r = conn.execute("SELECT version FROM fincoach_schema").fetchone()
+        return r[0] if r else 0
+
+    def migrate(self, conn):
+        from storage import MIGRATE
+        if not MIGRATE: return
+        try:
+            conn.execute("SELECT pg_advisory_xact_lock(?)", (LOCK_ID,))
+            conn.execute("CREATE TABLE IF NOT EXISTS fincoach_schema (version INTEGER NOT NULL)")
+            r = conn.execute("SELECT version FROM fincoach_schema").fetchone()
+            v = r[0] if r else 0
+            for i in range(v, SCHEMA_VERSION):
+                for stmt in MIGRATIONS[i]: conn.execute(stmt)
+            if r is None: conn.execute("INSERT INTO fincoach_schema(version) VALUES(?)", (SCHEMA_VERSION,))
+            else: conn.execute("UPDATE fincoach_schema SET version=?", (SCHEMA_VERSION,))
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
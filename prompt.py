@@ -0,0 +1,113 @@
+import os, re, json
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+TOOL_OUTPUT_TOKENS = int(os.getenv("TOOL_OUTPUT_TOKENS", 600))
+MESSAGE_OVERHEAD = 4
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("o200k_base")
+    def count_tokens(text):
+        return len(_enc.encode(text or ""))
+except Exception:
+    _WORDS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+    # Without tiktoken: words and punctuation marks, with long words counted as several pieces.
+    def count_tokens(text):
+        return sum(1 + len(w) // 6 for w in _WORDS.findall(text or ""))
+
+def message_tokens(m):
+    n = MESSAGE_OVERHEAD + count_tokens(m.get("content") or "")
+    for tc in m.get("tool_calls") or []:
+        n += count_tokens(tc["function"]["name"]) + count_tokens(tc["function"]["arguments"])
+    return n
+
+def messages_tokens(msgs):
+    return sum(message_tokens(m) for m in msgs)
+
+def trimmed_note(dropped):
+    asks = [m["content"].strip().splitlines()[0][:60] for m in dropped if m["role"] == "user" and (m.get("content") or "").strip()]
+    note = f"Earlier conversation ({len(dropped)} messages) omitted to save space."
+    if asks: note += " The user had asked about: " + "; ".join(asks[-4:]) + "."
+    return {"role":"system","content": note}
+
+def build_messages(system, history, user_text, budget=None):
+    budget = budget or PROMPT_TOKEN_BUDGET
+    head = [{"role":"system","content": system}]
+    tail = [{"role":"user","content": user_text}]
+    left = budget - messages_tokens(head) - messages_tokens(tail)
+    keep = []
+    for m in reversed(history):
+        n = message_tokens(m)
+        if n > left: break
+        keep.append(m); left -= n
+    keep.reverse()
+    dropped = history[:len(history) - len(keep)]
+    if dropped:
+        note = trimmed_note(dropped)
+        while keep and message_tokens(note) > left:
+            left += message_tokens(keep.pop(0))
+        head.append(note)
+    return head + keep + tail
+
+def _json(out):
+    return json.dumps(out, separators=(",",":"), ensure_ascii=False, default=str)
+
+# Largest list or long string anywhere in out, by serialized size: (size, path, parent, key).
+def _largest(x, path="", parent=None, key=None):
+    best = None
+    if isinstance(x, dict): kids = x.items()
+    elif isinstance(x, list): kids = enumerate(x)
+    else: kids = ()
+    for k,v in kids:
+        b = _largest(v, f"{path}.{k}" if path else str(k), x, k)
+        if b and (best is None or b[0] > best[0]): best = b
+    if parent is not None and (isinstance(x, list) and x or isinstance(x, str) and len(x) > 80):
+        n = len(_json(x))
+        if best is None or n > best[0]: best = (n, path, parent, key)
+    return best
+
+# Over the limit, halves the largest list (dropping its tail) or long string until the output fits; the result
+# stays valid JSON and its "truncated" key counts what was dropped at each path.
+def dumps(out, limit=None):
+    s = _json(out)
+    limit = limit or TOOL_OUTPUT_TOKENS
+    if count_tokens(s) <= limit: return s
+    out = json.loads(s)
+    if not isinstance(out, dict): out = {"result": out}
+    dropped = {}
+    while count_tokens(s) > limit:
+        b = _largest(out)
+        if b is None: break
+        _, path, parent, key = b
+        v = parent[key]
+        if isinstance(v, list):
+            parent[key] = v[:len(v) // 2]
+            dropped[path] = dropped.get(path, 0) + len(v) - len(parent[key])
+        else:
+            parent[key] = v[:len(v) // 2] + "…"
+            dropped[path] = "shortened"
+        s = _json({**out, "truncated": dropped})
+    return s
+
+_MD = re.compile(r"\*\*")
+
+def plain(text):
+    return _MD.sub("", text or "")
+
+def compact_analysis(out):
+    return {"figures": out.get("figures"), "actions": [plain(a["title"]) + " — " + plain(a["cta"]) for a in out.get("actions", [])]}
+
+def compact_state(out):
+    prof = {k:v for k,v in out.get("profile", {}).items() if v not in (None, "")}
+    return {"profile": prof, "missing": {m["field"]: m["prompt"] for m in out.get("missing", [])[:3]}, "missing_count": len(out.get("missing", [])), "has_transactions": out.get("has_transactions"), "caps": {c["category"]: c["weekly"] for c in out.get("caps", [])}, "alerts": [f"{e['category']} {e['level']} {e['spent']:.0f}/{e['weekly']:.0f} ({e['week']})" for e in out.get("alerts", [])]}
+
+def compact_caps(out):
+    r = {k:v for k,v in out.items() if k != "caps"}
+    if "caps" in out: r["caps"] = {c["category"]: [c["weekly"], c["spent"]] if "spent" in c else c["weekly"] for c in out["caps"]}
+    if any("spent" in c for c in out.get("caps", [])): r["caps_format"] = "category: [weekly cap, spent this week]"
+    return r
+
+def compact_profile_update(out):
+    r = {k:v for k,v in out.items() if k != "profile"}
+    if "profile" in out: r["profile_fields_set"] = len(out["profile"])
+    return r
@@ -0,0 +1,118 @@
+import re, json
+from collections import defaultdict
+from datetime import date
+from functools import lru_cache
+import numpy as np
+from storage import db_for
+
+# name: (days, tolerance, min occurrences)
+PERIODS = {"weekly": (7, 1, 4), "biweekly": (14, 2, 3), "monthly": (30.44, 4, 3), "quarterly": (91.3, 8, 2), "annual": (365.25, 12, 2)}
+GAP_SHARE = 0.7      # share of gaps that must fall in the period's band
+AMOUNT_TOL = 0.25    # an occurrence "matches" when within 25% of the median amount
+AMOUNT_SHARE = 0.6
+TAIL = 24            # occurrences kept per merchant so new rows can be scored without the full history
+
+_NAMES = list(PERIODS)
+_P = np.array([p[0] for p in PERIODS.values()])
+_T = np.array([p[1] for p in PERIODS.values()])
+_MIN = np.array([p[2] for p in PERIODS.values()])
+
+_SEP = re.compile(r"[/|\\:_*#,;()\[\]+-]+")
+_HANDLE = re.compile(r"@\S+")
+_DIGITS = re.compile(r"\S*\d\S*")
+_PUNCT = re.compile(r"[^a-z ]+")
+NOISE = {"upi","imps","neft","rtgs","ach","nach","ecs","pos","ref","txn","utr","autopay","mandate","si","dr","cr","to","by","from","via","payment","pmt","jan","feb","mar","apr","may","jun","jul","aug","sep","sept","oct","nov","dec","january","february","march","april","june","july","august","september","october","november","december"}
+
+@lru_cache(maxsize=65536)
+def merchant_key(desc):
+    s = _HANDLE.sub(" ", _SEP.sub(" ", (desc or "").lower()))
+    s = _PUNCT.sub(" ", _DIGITS.sub(" ", s))
+    return " ".join(list(dict.fromkeys(w for w in s.split() if len(w) > 1 and w not in NOISE))[:3])
+
+# Scores every group (an int id per row) at once: one sort, then gap medians and band shares as array ops, O(n log n).
+def detect(g, dates, amounts, min_occ=None):
+    g, dates, amounts = np.asarray(g), np.asarray(dates), np.asarray(amounts, dtype=np.float64)
+    if len(g) < 2: return []
+    order = np.lexsort((dates, g))
+    gs, d, a = g[order], dates[order], amounts[order]
+    starts = np.flatnonzero(np.r_[True, gs[1:] != gs[:-1]])
+    ends = np.r_[starts[1:], len(gs)]
+    counts = ends - starts
+    G = len(starts)
+    grp = np.repeat(np.arange(G), counts)
+    same = gs[1:] == gs[:-1]
+    gg, gaps = grp[1:][same], np.diff(d)[same]
+    ng = counts - 1
+    sg = gaps[np.lexsort((gaps, gg))]
+    med_gap = np.full(G, -1.0)
+    has = ng > 0
+    med_gap[has] = sg[(np.cumsum(ng) - ng)[has] + ng[has] // 2]
+    fit = np.abs(med_gap[:, None] - _P[None, :]) <= _T[None, :]
+    band = np.where(fit.any(axis=1), fit.argmax(axis=1), -1)
+    b = band[gg]
+    inb = (b >= 0) & (np.abs(gaps - _P[b]) <= _T[b])
+    n_in = np.bincount(gg, weights=inb, minlength=G)
+    share = n_in / np.maximum(ng, 1)
+    every = np.bincount(gg, weights=gaps * inb, minlength=G) / np.maximum(n_in, 1)
+    med_amt = a[np.lexsort((a, grp))][starts + counts // 2]
+    amt_share = np.bincount(grp, weights=np.abs(a - med_amt[grp]) <= AMOUNT_TOL * np.abs(med_amt[grp]), minlength=G) / counts
+    need = _MIN[band] if min_occ is None else np.maximum(_MIN[band], min_occ)
+    ok = (band >= 0) & (counts >= need) & (share >= GAP_SHARE) & (amt_share >= AMOUNT_SHARE)
+    first, last = d[starts], d[ends - 1]
+    out = []
+    for i in np.flatnonzero(ok)[np.lexsort((gs[starts][ok], first[ok]))]:
+        out.append({"key": int(gs[starts[i]]), "period": _NAMES[band[i]], "every_days": round(float(every[i]), 1), "amount": float(med_amt[i]), "count": int(counts[i]), "first": int(first[i]), "last": int(last[i])})
+    return out
+
+def entry(name, s, end):
+    every = s["every_days"]
+    return {"merchant": name, "name": name or ("recurring income" if s["amount"] > 0 else "recurring bill"), "amount": abs(s["amount"]), "period": s["period"], "every_days": every, "count": s["count"], "last": date.fromordinal(s["last"]).isoformat(), "active": bool(end - s["last"] <= 1.5 * every + PERIODS[s["period"]][1])}
+
+def monthly(e):
+    return e["amount"] * PERIODS["monthly"][0] / e["every_days"] if e["active"] else 0.0
+
+# --- incremental state: one row per (sid, merchant, kind) holding the last TAIL occurrences and the current verdict
+
+def update(conn, sid, rows):
+    new = defaultdict(list)
+    for r in rows:
+        new[(merchant_key(r["description"]), "income" if r["amount"] > 0 else "bill")].append([r["date"].toordinal(), r["amount"]])
+    if not new: return 0
+    old = {}
+    merchants = list({m for m,_ in new})
+    for i in range(0, len(merchants), 900):
+        part = merchants[i:i+900]
+        q = f"SELECT merchant,kind,tail,count,first FROM recurring_state WHERE sid=? AND merchant IN ({','.join('?'*len(part))})"
+        old.update(((x["merchant"], x["kind"]), x) for x in conn.execute(q, (sid, *part)))
+    keys = list(new)
+    tails, counts, firsts = [], [], []
+    for k in keys:
+        o = old.get(k)
+        t = sorted((json.loads(o["tail"]) if o else []) + new[k])
+        tails.append(t[-TAIL:])
+        counts.append((o["count"] if o else 0) + len(new[k]))
+        firsts.append(min(o["first"], t[0][0]) if o else t[0][0])
+    flat = np.array([x for t in tails for x in t], dtype=np.float64)
+    g = np.repeat(np.arange(len(keys)), [len(t) for t in tails])
+    found = {s["key"]: s for s in detect(g, flat[:, 0].astype(np.int64), flat[:, 1])}
+    ups = []
+    for i,(m,kind) in enumerate(keys):
+        s = found.get(i)
+        ups.append((sid, m, kind, json.dumps(tails[i]), counts[i], firsts[i], int(tails[i][-1][0]), s and s["period"], s and s["every_days"], s and s["amount"]))
+    conn.executemany("INSERT INTO recurring_state(sid,merchant,kind,tail,count,first,last,period,every_days,amount) VALUES(?,?,?,?,?,?,?,?,?,?) ON CONFLICT(sid,merchant,kind) DO UPDATE SET tail=excluded.tail, count=excluded.count, first=excluded.first, last=excluded.last, period=excluded.period, every_days=excluded.every_days, amount=excluded.amount", ups)
+    return len(ups)
+
+def rebuild(conn, sid):
+    conn.execute("DELETE FROM recurring_state WHERE sid=?", (sid,))
+    rows = conn.execute("SELECT date,description,amount FROM txns WHERE sid=? ORDER BY date", (sid,)).fetchall()
+    return update(conn, sid, [{"date": date.fromisoformat(r["date"][:10]), "description": r["description"], "amount": r["amount"]} for r in rows])
+
+def load(sid):
+    rec = {"income":[], "bills":[]}
+    with db_for(sid) as conn:
+        end = conn.execute("SELECT MAX(date) FROM txns WHERE sid=?", (sid,)).fetchone()[0]
+        rows = conn.execute("SELECT merchant,kind,count,first,last,period,every_days,amount FROM recurring_state WHERE sid=? AND period IS NOT NULL ORDER BY first, merchant", (sid,)).fetchall()
+    end = date.fromisoformat(end[:10]).toordinal() if end else 0
+    for r in rows:
+        rec["income" if r["kind"] == "income" else "bills"].append(entry(r["merchant"], dict(r), end))
+    return rec
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from storage import db_for
+
+# rollups(sid, week, category, total, count): signed sum of amounts per ISO week, so spend is -total.
+
+def week_key(d):
+    y, w, _ = d.isocalendar()
+    return f"{y}-W{w:02d}"
+
+def _as_date(d):
+    return d if isinstance(d, date) else date.fromisoformat(str(d)[:10])
+
+def add(conn, sid, rows, sign=1):
+    agg = defaultdict(lambda: [0.0, 0])
+    for r in rows:
+        a = agg[(week_key(_as_date(r["date"])), r["category"] or "other")]
+        a[0] += sign * r["amount"]; a[1] += sign
+    conn.executemany("INSERT INTO rollups(sid,week,category,total,count) VALUES(?,?,?,?,?) ON CONFLICT(sid,week,category) DO UPDATE SET total=rollups.total+excluded.total, count=rollups.count+excluded.count", [(sid, w, c, t, n) for (w,c),(t,n) in agg.items()])
+    conn.execute("DELETE FROM rollups WHERE sid=? AND count<=0", (sid,))
+    return agg
+
+def recategorized(conn, sid, moves):
+    # moves: (row, old_category) for rows whose category changed to row["category"]
+    out = add(conn, sid, [{**r, "category": old} for r,old in moves], -1)
+    for k,(t,n) in add(conn, sid, [r for r,_ in moves]).items():
+        d = out[k]; d[0] += t; d[1] += n
+    return out
+
+def rebuild(conn, sid):
+    conn.execute("DELETE FROM rollups WHERE sid=?", (sid,))
+    add(conn, sid, conn.execute("SELECT date,amount,category FROM txns WHERE sid=?", (sid,)).fetchall())
+
+def latest(conn, sid):
+    d = conn.execute("SELECT MAX(date) FROM txns WHERE sid=?", (sid,)).fetchone()[0]
+    return _as_date(d) if d else date.today()
+
+# Windows are anchored on the session's latest transaction, since data arrives as statements rather than live.
+def week_spend(sid, on=None):
+    with db_for(sid) as conn:
+        w = week_key(on or latest(conn, sid))
+        rows = conn.execute("SELECT category,total FROM rollups WHERE sid=? AND week=?", (sid, w)).fetchall()
+    return w, {r["category"]: round(-r["total"], 2) for r in rows if r["total"] < 0}
+
+def trailing(sid, weeks=4, on=None):
+    with db_for(sid) as conn:
+        on = on or latest(conn, sid)
+        lo = week_key(on - timedelta(weeks=weeks - 1))
+        rows = conn.execute("SELECT category,SUM(total) AS total,SUM(count) AS n FROM rollups WHERE sid=? AND week BETWEEN ? AND ? GROUP BY category", (sid, lo, week_key(on))).fetchall()
+    return {r["category"]: {"spent": round(-r["total"], 2), "weekly_avg": round(-r["total"] / weeks, 2), "count": r["n"]} for r in rows if r["total"] < 0}
+
+def cap_status(sid, on=None):
+    with db_for(sid) as conn:
+        w = week_key(on or latest(conn, sid))
+        rows = conn.execute("SELECT c.category,c.weekly,COALESCE(-r.total,0.0) AS spent FROM caps c LEFT JOIN rollups r ON r.sid=c.sid AND r.week=? AND r.category=c.category WHERE c.sid=? ORDER BY c.category", (w, sid)).fetchall()
+    return w, [{"category": r["category"], "weekly": float(r["weekly"]), "spent": round(max(r["spent"], 0.0), 2), "left": round(r["weekly"] - max(r["spent"], 0.0), 2)} for r in rows]
@@ -0,0 +1,342 @@
+import os, sqlite3, threading, hashlib
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import TimedConnection
+
+DB_PATH = os.getenv("FINCOACH_DB", "fincoach.db")
+DATABASE_URL = os.getenv("FINCOACH_DATABASE_URL", "")   # postgresql://... keeps everything in PostgreSQL instead of SQLite files
+SHARDS = int(os.getenv("FINCOACH_SHARDS", 1))   # >1 spreads sessions over FINCOACH_DB.<n> files by hash of sid
+MIGRATE = os.getenv("FINCOACH_MIGRATE", "on") == "on"   # off: the schema was migrated out-of-band (python storage.py)
+
+# Tables keyed by sid live in the session's shard; jobs, llm_cache and reports stay in DB_PATH.
+SESSION_TABLES = ["profiles", "txns", "history", "history_archive", "caps", "category_rules", "data_versions",
+                  "turn_usage", "recurring_state", "rollups", "cap_events"]
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+]
+
+def txn_key(d, desc, amount):
+    return (d if isinstance(d, str) else d.isoformat(), (desc or "").strip().lower(), round(float(amount), 2))
+
+# n is the occurrence of an identical (date, description, amount) row, so genuine repeats on one day survive dedup.
+def txn_hash(key, n=0):
+    return hashlib.sha1(f"{key[0]}|{key[1]}|{key[2]:.2f}|{n}".encode()).hexdigest()[:20]
+
+def _backfill_txn_hashes(conn):
+    seen = Counter()
+    ups = []
+    for r in conn.execute("SELECT rowid,sid,date,description,amount FROM txns ORDER BY sid,date,rowid"):
+        k = txn_key(r["date"], r["description"], r["amount"])
+        ups.append((txn_hash(k, seen[(r["sid"],k)]), r["rowid"]))
+        seen[(r["sid"],k)] += 1
+    conn.executemany("UPDATE txns SET hash=? WHERE rowid=?", ups)
+
+def _backfill_recurring(conn):
+    import recurring
+    for (sid,) in conn.execute("SELECT DISTINCT sid FROM txns").fetchall():
+        recurring.rebuild(conn, sid)
+
+def _backfill_rollups(conn):
+    import rollups
+    for (sid,) in conn.execute("SELECT DISTINCT sid FROM txns").fetchall():
+        rollups.rebuild(conn, sid)
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records how far a file has got.
+MIGRATIONS = [
+    [
+        "CREATE TABLE IF NOT EXISTS profiles (sid TEXT, key TEXT, value TEXT, PRIMARY KEY (sid,key));",
+        "CREATE TABLE IF NOT EXISTS txns (sid TEXT, date TEXT, description TEXT, amount REAL, category TEXT);",
+        "CREATE TABLE IF NOT EXISTS history (sid TEXT, role TEXT, content TEXT, ts TEXT);",
+        "CREATE TABLE IF NOT EXISTS caps (sid TEXT, category TEXT, weekly REAL, PRIMARY KEY (sid,category));",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_txns_sid_date ON txns(sid,date);",
+        "CREATE INDEX IF NOT EXISTS idx_history_sid_ts ON history(sid,ts);",
+    ],
+    [
+        "CREATE TABLE history_v3 (seq INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT, role TEXT, content TEXT, ts TEXT);",
+        "INSERT INTO history_v3(sid,role,content,ts) SELECT sid,role,content,ts FROM history ORDER BY ts,rowid;",
+        "DROP TABLE history;",
+        "ALTER TABLE history_v3 RENAME TO history;",
+        "CREATE INDEX IF NOT EXISTS idx_history_sid_seq ON history(sid,seq);",
+        "CREATE TABLE IF NOT EXISTS history_archive (sid TEXT, seq_from INTEGER, seq_to INTEGER, ts_from TEXT, ts_to TEXT, turns INTEGER, summary TEXT, body TEXT);",
+        "CREATE INDEX IF NOT EXISTS idx_history_archive_sid ON history_archive(sid,seq_to);",
+    ],
+    [
+        "ALTER TABLE txns ADD COLUMN hash TEXT;",
+        _backfill_txn_hashes,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_txns_sid_hash ON txns(sid,hash);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS category_rules (sid TEXT, pattern TEXT, category TEXT, PRIMARY KEY (sid,pattern));",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS data_versions (sid TEXT PRIMARY KEY, version INTEGER NOT NULL);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS turn_usage (sid TEXT, ts TEXT, iterations INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, seconds REAL);",
+        "CREATE INDEX IF NOT EXISTS idx_turn_usage_sid ON turn_usage(sid,ts);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, bytes INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, seconds REAL, created TEXT, last_used TEXT, hits INTEGER);",
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS recurring_state (sid TEXT, merchant TEXT, kind TEXT, tail TEXT, count INTEGER, first INTEGER, last INTEGER, period TEXT, every_days REAL, amount REAL, PRIMARY KEY(sid, merchant, kind));",
+        _backfill_recurring,
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS rollups (sid TEXT, week TEXT, category TEXT, total REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY(sid, week, category));",
+        _backfill_rollups,
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS cap_events (id INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT, ts TEXT, week TEXT, category TEXT, level TEXT, spent REAL, weekly REAL, seen INTEGER NOT NULL DEFAULT 0, UNIQUE(sid, week, category, level));",
+        "CREATE INDEX IF NOT EXISTS idx_cap_events_sid_seen ON cap_events(sid, seen, id);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT, kind TEXT, args TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, run_after REAL NOT NULL DEFAULT 0, result TEXT, error TEXT, created TEXT, started TEXT, finished TEXT);",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_sid ON jobs(sid, status);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS report_runs (run TEXT PRIMARY KEY, started TEXT, finished TEXT, total INTEGER, done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0);",
+        "CREATE TABLE IF NOT EXISTS reports (run TEXT, sid TEXT, ts TEXT, version INTEGER, status TEXT, result TEXT, PRIMARY KEY(run, sid));",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_txns_sid_amount ON txns(sid,amount,description);",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_local = threading.local()
+_lock = threading.Lock()
+_migrated = set()
+
+def connect(path=None):
+    c = sqlite3.connect(path or DB_PATH, timeout=5.0, check_same_thread=False, factory=TimedConnection)
+    c.row_factory = sqlite3.Row
+    for p in PRAGMAS:
+        c.execute(p)
+    return c
+
+def _sqlite(path):
+    pool = getattr(_local, "pool", None)
+    if pool is None or _local.pid != os.getpid():
+        pool = _local.pool = {}
+        _local.pid = os.getpid()
+    c = pool.get(path)
+    if c is None:
+        c = pool[path] = connect(path)
+    if path not in _migrated:
+        if MIGRATE: migrate(c)
+        _migrated.add(path)
+    return c
+
+def shard_of(sid, shards=None):
+    shards = SHARDS if shards is None else shards
+    return int(hashlib.blake2b(str(sid).encode(), digest_size=4).hexdigest(), 16) % shards if shards > 1 else 0
+
+def shard_path(i, path=None, shards=None):
+    path, shards = path or DB_PATH, SHARDS if shards is None else shards
+    if shards <= 1: return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{i}{ext or '.db'}"
+
+# Storage backends. Helpers reach data only through db() (jobs, LLM cache, reports) and db_for(sid) (one
+# session's rows), which ask the configured backend for a connection with sqlite3's surface: execute and
+# executemany with ? placeholders, rows readable by index or column name, commit/rollback, and `with`
+# committing on success. part(sid) names where a session lives, parts() lists them all for cross-session scans.
+class SQLiteBackend:
+    def __init__(self, path=DB_PATH, shards=SHARDS):
+        self.path, self.shards = path, shards
+
+    def connect(self, part=None):
+        return _sqlite(part or self.path)
+
+    def part(self, sid):
+        return shard_path(shard_of(sid, self.shards), self.path, self.shards)
+
+    def parts(self):
+        return [shard_path(i, self.path, self.shards) for i in range(max(self.shards, 1))]
+
+    def version(self, part=None):
+        return schema_version(self.connect(part))
+
+def _default_backend():
+    if DATABASE_URL:
+        from pgstore import PostgresBackend
+        return PostgresBackend(DATABASE_URL)
+    return SQLiteBackend()
+
+BACKEND = _default_backend()
+
+def use(backend):
+    global BACKEND
+    BACKEND = backend
+    return backend
+
+def db():
+    return BACKEND.connect()
+
+# Connection for one session's data. With SQLite shards, writers on different shards never contend for one file lock.
+def db_for(sid):
+    return BACKEND.connect(BACKEND.part(sid))
+
+def partitions():
+    for p in BACKEND.parts(): yield BACKEND.connect(p)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    with _lock:
+        v = schema_version(conn)
+        if v >= SCHEMA_VERSION: return v
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            v = schema_version(conn)
+            for i in range(v, SCHEMA_VERSION):
+                for stmt in MIGRATIONS[i]:
+                    if callable(stmt): stmt(conn)
+                    else: conn.execute(stmt)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+    return SCHEMA_VERSION
+
+# Bumped inside every transaction that changes a session's profile, transactions or caps; cached results are keyed on it.
+def bump_version(conn, sid, n=1):
+    conn.execute("INSERT INTO data_versions(sid,version) VALUES(?,?) ON CONFLICT(sid) DO UPDATE SET version=data_versions.version+excluded.version", (sid, n))
+
+def data_version(sid):
+    with db_for(sid) as conn:
+        r = conn.execute("SELECT version FROM data_versions WHERE sid=?", (sid,)).fetchone()
+    u = pending(sid)
+    return (r[0] if r else 0) + (u.bumps if u else 0)
+
+# Unit of work: inside `with unit_of_work(sid)`, write() queues statements and read() memoizes per key, and the
+# queue is applied in one transaction when the block exits. Units for the same sid run one at a time. Nothing is
+# held open in SQLite meanwhile, so a turn waiting on the model never blocks writers of other sessions.
+# Only write() is deferred: imports, caps, category rules, jobs and the LLM cache still commit as they happen,
+# because cap_status and job workers read those tables directly.
+class Unit:
+    __slots__ = ("sid","writes","bumps","memo","lock")
+
+    def __init__(self, sid):
+        self.sid, self.writes, self.bumps, self.memo, self.lock = sid, [], 0, {}, threading.RLock()
+
+_unit = ContextVar("fincoach_unit", default=None)
+_sid_locks = {}
+_sid_lock = threading.Lock()
+
+def pending(sid):
+    u = _unit.get()
+    return u if u is not None and u.sid == sid else None
+
+@contextmanager
+def unit_of_work(sid):
+    u = pending(sid)
+    if u is not None:
+        yield u
+        return
+    with _sid_lock:
+        e = _sid_locks.setdefault(sid, [threading.Lock(), 0])
+        e[1] += 1
+    e[0].acquire()
+    u = Unit(sid)
+    tok = _unit.set(u)
+    try:
+        yield u
+    finally:
+        _unit.reset(tok)
+        try: flush(u)
+        finally:
+            e[0].release()
+            with _sid_lock:
+                e[1] -= 1
+                if not e[1]: _sid_locks.pop(sid, None)
+
+def flush(u):
+    if not u.writes and not u.bumps: return
+    conn = db_for(u.sid)
+    try:
+        for sql,args in u.writes: conn.execute(sql, args)
+        if u.bumps: bump_version(conn, u.sid, u.bumps)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    u.writes, u.bumps = [], 0
+
+def write(sid, sql, args=(), bump=False):
+    u = pending(sid)
+    if u is None:
+        with db_for(sid) as conn:
+            conn.execute(sql, args)
+            if bump: bump_version(conn, sid)
+            conn.commit()
+        return
+    with u.lock:
+        u.writes.append((sql, args))
+        u.bumps += bool(bump)
+
+def read(sid, key, fn):
+    u = pending(sid)
+    if u is None: return fn()
+    with u.lock:
+        if key not in u.memo: u.memo[key] = fn()
+        return u.memo[key]
+
+def forget_reads(sid, *keys):
+    u = pending(sid)
+    if u is None: return
+    with u.lock:
+        for k in keys or list(u.memo): u.memo.pop(k, None)
+
+# Drops queued writes, e.g. ahead of deleting everything the session has; version bumps are kept.
+def discard(sid):
+    u = pending(sid)
+    if u is None: return
+    with u.lock:
+        u.writes.clear()
+        u.memo.clear()
+
+def init_db():
+    for p in BACKEND.parts(): BACKEND.connect(p)
+    return BACKEND.version()
+
+# Copies session rows from a single-file SQLite database into the current shards; the source is left untouched.
+def reshard(src=None):
+    src = src or DB_PATH
+    init_db()
+    conn = connect(src)
+    conn.create_function("shard_of", 1, shard_of, deterministic=True)
+    moved = {}
+    try:
+        for i in range(SHARDS):
+            if os.path.abspath(shard_path(i)) == os.path.abspath(src): continue
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path(i),))
+            for t in SESSION_TABLES:
+                n = conn.execute(f"INSERT OR IGNORE INTO shard.{t} SELECT * FROM main.{t} WHERE shard_of(sid)=?", (i,)).rowcount
+                moved[t] = moved.get(t, 0) + n
+            conn.commit()
+            conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+    return moved
+
+if __name__ == "__main__":
+    import sys, json
+    if sys.argv[1:2] == ["reshard"]:
+        print(json.dumps(reshard(sys.argv[2] if len(sys.argv) > 2 else None)))
+    else:
+        print(json.dumps({"backend": type(BACKEND).__name__, "schema": init_db(), "parts": [p for p in BACKEND.parts() if p]}))
@@ -0,0 +1,58 @@
+import os, sys, json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage, metrics
+
+@pytest.fixture(autouse=True)
+def backend(tmp_path):
+    old = storage.BACKEND
+    storage.use(storage.SQLiteBackend(str(tmp_path / "t.db"), 1))
+    yield
+    storage.use(old)
+
+def call(name, arguments):
+    import main, agent
+    return agent.call_tool("s1", {"function": {"name": name, "arguments": arguments}})
+
+def errors(tool):
+    return metrics._counters[metrics._key("fincoach_tool_errors_total", {"tool": tool})]
+
+@pytest.mark.parametrize("name,arguments", [
+    ("set_caps_bulk", json.dumps({"items": [{"weekly": 500}]})),
+    ("set_caps_bulk", json.dumps({"items": [{"category": None, "weekly": 500}]})),
+    ("set_caps_bulk", json.dumps({"items": "food"})),
+    ("set_cap", json.dumps({"category": "food", "weekly": "lots"})),
+    ("plan_goal", json.dumps({"target": 50000, "weeks": None})),
+    ("set_cap", "[1, 2]"),
+    ("set_cap", "{not json"),
+])
+def test_malformed_arguments_fail_the_call_not_the_turn(name, arguments):
+    import main, jobs
+    if name == "plan_goal":
+        main.insert_txns("s1", main.enrich_transactions(main.parse_csv(main.DEMO_CSV)))
+        jobs.wait_idle("s1")
+    before = errors(name)
+    payload, info = call(name, arguments)
+    assert "error" in json.loads(payload)
+    assert info["name"] == name
+    assert errors(name) == before + 1
+
+def test_valid_call_still_succeeds():
+    payload, _ = call("set_cap", json.dumps({"category": "food", "weekly": 500}))
+    assert json.loads(payload)["ok"] is True
+
+def test_chat_survives_a_failing_tool(monkeypatch):
+    import main, agent
+    from types import SimpleNamespace as NS
+    steps = [[NS(index=0, id="c0", function=NS(name="set_caps_bulk", arguments='{"items":[{"category":null}]}'))], "Caps need a category."]
+    def create(**kw):
+        step = steps.pop(0)
+        delta = NS(content=None, tool_calls=step) if isinstance(step, list) else NS(content=step, tool_calls=None)
+        return iter([NS(choices=[NS(delta=delta)], usage=None)])
+    monkeypatch.setattr(agent, "chat_create", create)
+    monkeypatch.setattr(agent, "API_KEY", "test")
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    cl = main.create_app().test_client()
+    r = cl.post("/chat", json={"text": "cap food please"})
+    assert r.status_code == 200 and "category" in r.json["text"]
@@ -0,0 +1,64 @@
+import os, sys, random
+from collections import defaultdict
+from datetime import date, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics
+from ledger import Txns
+from recurring import merchant_key
+
+# The pure-Python loops analytics.py replaced, kept as the reference its column code must reproduce.
+# Sums run left to right in an explicit loop, as the loops did (sum() compensates on Python 3.12+).
+
+def ref_totals(txns):
+    inc = exp = 0
+    for t in txns:
+        if t["amount"] > 0: inc += t["amount"]
+        elif t["amount"] < 0: exp += -t["amount"]
+    return inc, exp
+
+def ref_category_spend(txns, days=30):
+    if not txns: return {}
+    start = txns[-1]["date"] - timedelta(days=days)
+    out = defaultdict(float)
+    for t in txns:
+        if t["date"] >= start and t["amount"] < 0:
+            out[t["category"]] += abs(t["amount"])
+    return dict(sorted(out.items(), key=lambda x:x[1], reverse=True))
+
+def ref_income_sources(txns):
+    return len({merchant_key(t["description"]) for t in txns if t["amount"] > 0})
+
+MERCHANTS = ["Salary Acme", "Amazon Shopping", "Uber Ride", "Electricity Bill", "UPI Transfer 9812", "Swiggy", "Netflix",
+             "DMart", "Rent Landlord", "Freelance Upwork", "Pharmacy Med", "ATM Withdrawal"]
+CATEGORIES = ["income", "shopping", "transport", "utilities", "transfer", "food", "subscriptions", "groceries", "rent", "health", "other"]
+
+def dataset(seed):
+    rnd = random.Random(seed)
+    d0 = date(2024, 1, 1) + timedelta(days=rnd.randint(0, 365))
+    rows = []
+    for _ in range(rnd.choice([0, 1, 2, 10, 100, 1000])):
+        m = rnd.choice(MERCHANTS)
+        sign = 1 if m.startswith(("Salary", "Freelance")) or rnd.random() < 0.05 else -1
+        amount = sign * (round(rnd.uniform(1, 50000), 2) if rnd.random() < 0.9 else rnd.uniform(0, 1e-3))
+        rows.append({"date": d0 + timedelta(days=rnd.randint(0, 400)), "description": m + (f" {rnd.randint(1, 99)}" if rnd.random() < 0.3 else ""),
+                     "amount": amount, "category": rnd.choice(CATEGORIES)})
+    rows.sort(key=lambda t: t["date"])
+    return rows
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_pure_python(seed):
+    rows = dataset(seed)
+    for cols in (analytics.Columns(rows), analytics.Columns(Txns.from_rows(rows))):
+        assert analytics.totals(cols) == ref_totals(rows)
+        for days in (7, 30, 90):
+            got, want = analytics.category_spend(cols, days), ref_category_spend(rows, days)
+            assert got == want and list(got) == list(want)
+        assert analytics.income_sources(cols) == ref_income_sources(rows)
+
+def test_shortfall_wording_with_negative_starting_balance():
+    import main
+    rows = [{"date": date(2025, 1, 1) + timedelta(days=i), "description": "Salary Acme" if i % 7 == 0 else "Swiggy", "amount": 5000.0 if i % 7 == 0 else -100.0, "category": "other"} for i in range(60)]
+    shortfall = [a for a in main.make_recommendations_from_txns(rows, -1000.0)["actions"] if a["title"].startswith("Shortfall")]
+    assert shortfall and "already below zero" in shortfall[0]["detail"] and "None" not in shortfall[0]["detail"]
@@ -0,0 +1,28 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage
+from cache import cached, analysis_cache
+
+@pytest.fixture(autouse=True)
+def backend(tmp_path):
+    old = storage.BACKEND
+    storage.use(storage.SQLiteBackend(str(tmp_path / "t.db"), 1))
+    analysis_cache.clear()
+    yield
+    storage.use(old)
+
+def test_pending_bumps_stay_out_of_shared_cache():
+    calls = []
+    compute = lambda: calls.append(1) or {"n": len(calls)}
+    with storage.unit_of_work("s1"):
+        storage.write("s1", "INSERT INTO profiles(sid,key,value) VALUES(?,?,?)", ("s1", "goal_name", "car"), bump=True)
+        v = storage.data_version("s1")
+        assert cached("k", "s1", v, compute) == {"n": 1}
+        assert cached("k", "s1", v, compute) == {"n": 1}
+    assert analysis_cache.stats()["entries"] == 0
+    # the committed version now equals the unit's, but the result computed inside the unit was never shared
+    assert storage.data_version("s1") == v
+    assert cached("k", "s1", v, compute) == {"n": 2}
+    assert analysis_cache.stats()["entries"] == 1
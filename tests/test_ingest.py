@@ -0,0 +1,54 @@
+import os, sys, io
+from datetime import date, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage, ingest
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import main, categorize, jobs
+    old = storage.BACKEND
+    storage.use(storage.SQLiteBackend(str(tmp_path / "t.db"), 1))
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    app = main.create_app()
+    cl = app.test_client()
+    with cl.session_transaction() as s: s["sid"] = "s1"
+    categorize.set_rule("s1", "coffee", "food")
+    yield cl
+    jobs.wait_idle("s1")
+    storage.use(old)
+
+def statement(n, start=date(2025, 1, 1)):
+    lines = ["date,description,amount"] + [f"{start + timedelta(days=i % 300)},Coffee {i},-{i % 90 + 1}" for i in range(n)]
+    return io.BytesIO("\n".join(lines).encode())
+
+def txn_count(sid):
+    with storage.db_for(sid) as conn:
+        return conn.execute("SELECT COUNT(*) FROM txns WHERE sid=?", (sid,)).fetchone()[0]
+
+def fail_on_chunk(monkeypatch, n):
+    calls, real = [], ingest.write_txns
+    def write_txns(*a, **k):
+        calls.append(1)
+        if len(calls) == n: raise RuntimeError("boom")
+        return real(*a, **k)
+    monkeypatch.setattr(ingest, "write_txns", write_txns)
+
+@pytest.mark.parametrize("mode", ["merge", "replace"])
+def test_failed_import_writes_nothing(client, monkeypatch, mode):
+    assert client.post("/upload?mode=replace", data={"file": (statement(10), "a.csv")}).status_code == 200
+    before = storage.data_version("s1")
+    fail_on_chunk(monkeypatch, 2)
+    assert client.post(f"/upload?mode={mode}", data={"file": (statement(ingest.CHUNK_ROWS + 1000, date(2024, 1, 1)), "b.csv")}).status_code == 500
+    assert txn_count("s1") == 10
+    assert storage.data_version("s1") == before
+
+def test_demo_confirms_only_once_its_job_is_done(client):
+    import main, jobs
+    r = client.post("/demo")
+    assert r.status_code == 202 and "loaded" not in r.json["text"]
+    jobs.wait(r.json["job"])
+    j = client.get(f"/jobs/{r.json['job']}").json
+    assert j["status"] == "done" and j["result"]["count"] == txn_count("s1")
+    assert main.get_history("s1")[-1]["content"].startswith("Sample data loaded ✅")
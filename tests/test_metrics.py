@@ -0,0 +1,46 @@
+import os, sys, json, time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage, metrics
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import main
+    old = storage.BACKEND
+    storage.use(storage.SQLiteBackend(str(tmp_path / "t.db"), 1))
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    yield main.create_app().test_client()
+    storage.use(old)
+
+def latency(endpoint):
+    return sum(h[-2] for (name,labels),h in metrics._hists.items() if name == "fincoach_http_request_seconds" and dict(labels)["endpoint"] == endpoint)
+
+def test_stream_is_timed_to_its_end(client, monkeypatch):
+    import main
+    def turn_events(sid, text):
+        metrics.span("model", 0.2)
+        time.sleep(0.05)
+        yield "done", "ok"
+    monkeypatch.setattr(main, "turn_events", turn_events)
+    before = latency("chat_stream")
+    r = client.post("/chat/stream", json={"text": "hi"})
+    body = r.get_data(as_text=True)
+    r.close()
+    assert "Server-Timing" not in r.headers
+    timing = json.loads(body.split("event: timing\ndata: ")[1].split("\n")[0])["server_timing"]
+    assert 'model;dur=200.0;desc="1"' in timing
+    assert latency("chat_stream") - before >= 0.05
+
+def test_label_values_are_escaped():
+    metrics.inc("fincoach_test_total", tool='a"b\\c\nd')
+    assert 'fincoach_test_total{tool="a\\"b\\\\c\\nd"} 1' in metrics.render()
+    assert "fincoach_tool_output_bytes_total" in metrics.HELP
+
+def test_secret_key_required_outside_dev(monkeypatch):
+    import main
+    monkeypatch.delenv("FLASK_SECRET_KEY", raising=False)
+    with pytest.raises(RuntimeError): main.create_app()
+    assert main.create_app(dev=True).secret_key == main.DEV_SECRET_KEY
+    monkeypatch.setenv("FLASK_SECRET_KEY", "shared")
+    assert main.create_app().secret_key == "shared"
@@ -0,0 +1,61 @@
+import os, sys, json, uuid
+from datetime import date
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage
+
+URL = os.getenv("FINCOACH_TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="FINCOACH_TEST_DATABASE_URL is not set")
+
+@pytest.fixture
+def backends(tmp_path):
+    from pgstore import PostgresBackend
+    old = storage.BACKEND
+    yield {"sqlite": storage.SQLiteBackend(str(tmp_path / "t.db"), 1), "postgres": PostgresBackend(URL)}
+    storage.use(old)
+
+def on(backend):
+    storage.use(backend)
+    return f"test-{uuid.uuid4().hex}"
+
+def test_schema(backends):
+    import pgstore
+    assert storage.use(backends["postgres"]).version() == pgstore.SCHEMA_VERSION
+
+def test_session_roundtrip(backends):
+    import main, history
+    sid = on(backends["postgres"])
+    rows = [{"date": date(2025, 3, d), "description": "Coffee", "amount": -120.0, "category": "food"} for d in (1, 1, 2)]
+    assert main.insert_txns(sid, rows)["inserted"] == 3
+    assert main.insert_txns(sid, rows, "merge")["skipped"] == 3
+    main.save_profile_field(sid, "monthly_income", "5,000")
+    main.set_cap(sid, "food", 200)
+    history.set_history(sid, "user", "hi 50%")
+    assert main.load_profile(sid)["monthly_income"] == 5000.0
+    assert main.list_caps(sid) == [{"category": "food", "weekly": 200.0}]
+    assert [m["content"] for m in history.get_history(sid)] == ["hi 50%"]
+    assert len(main.get_txns(sid)) == 3 and len(main.get_txns(sid, days=0)) == 1
+    assert storage.data_version(sid) == 4
+    main.clear_state(sid)
+    assert len(main.get_txns(sid)) == 0
+
+def test_analysis_matches_sqlite(backends):
+    import main
+    out = {}
+    for name,b in backends.items():
+        sid = on(b)
+        main.tool_load_demo_data(sid)
+        main.set_cap(sid, "shopping", 500)
+        res = main.compute_analysis(sid)
+        out[name] = json.dumps({k: res[k] for k in ("summary", "figures", "actions")}, sort_keys=True, default=str)
+    assert out["postgres"] == out["sqlite"]
+
+def test_jobs(backends):
+    import main, jobs
+    sid = on(backends["postgres"])
+    jid = jobs.submit(sid, "load_demo")
+    assert jobs.submit(sid, "load_demo") in (jid, jid + 1)
+    assert jobs.wait(jid)["status"] == "done"
+    assert jobs.wait_idle(sid)
+    assert len(main.get_txns(sid)) > 0
@@ -0,0 +1,28 @@
+import os, sys
+from datetime import date
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage, rollups
+
+@pytest.fixture
+def conn(tmp_path):
+    old = storage.BACKEND
+    storage.use(storage.SQLiteBackend(str(tmp_path / "t.db"), 1))
+    with storage.db_for("s1") as c:
+        yield c
+    storage.use(old)
+
+def test_recategorized_deltas(conn):
+    d = date(2025, 3, 4)
+    a = {"date": d, "amount": -100.0, "category": "food"}
+    b = {"date": d, "amount": -40.0, "category": "shopping"}
+    rollups.add(conn, "s1", [a, b])
+    # a: food -> shopping, b: shopping -> other, all in one week
+    out = rollups.recategorized(conn, "s1", [({**a, "category": "shopping"}, "food"), ({**b, "category": "other"}, "shopping")])
+    w = rollups.week_key(d)
+    assert out[(w, "food")] == [100.0, -1]
+    assert out[(w, "shopping")] == [-60.0, 0]
+    assert out[(w, "other")] == [-40.0, 1]
+    got = {r["category"]: r["total"] for r in conn.execute("SELECT category,total FROM rollups WHERE sid=?", ("s1",))}
+    assert got == {"shopping": -100.0, "other": -40.0}